@@ -1,73 +1,528 @@
 """
 Web service to work with assets, get actual information about
-daily currency rate and key indicators
+daily currency rate and key indicators.
+Serve it with app made by create_app(), e.g. gunicorn "asset_web_service:create_app()":
+import of module neither configures logging nor imports requests and lxml, they are loaded on first use
 """
-import logging.config
-import requests
+import atexit
+import base64
+import csv
+import importlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Optional
 
-from flask import Flask, render_template, abort, jsonify, request
-from lxml import etree
-import yaml
+from flask import Flask, Response, render_template, abort, g, jsonify, request
 
-from composite_store import AssetItem, CompositeAssetItem
+from composite_store import AssetItem, CompositeAssetItem, RevenueCache
+from compression import choose_encoding, compress, is_compressible, set_compressed_body
+import json_provider
+from json_provider import FastJSONProvider
+from logging_setup import configure_logging, load_logging_config
+from metrics import METRICS_CONTENT_TYPE, MetricsRegistry
+from persistent_store import PersistentAssetStore
+from sqlite_store import SQLiteAssetStore
 
 API_ROUTE = '/api/asset'
 APPLICATION_NAME = 'asset_web_service'
-CBR_BASE_URL = 'https://www.cbr.ru/eng/'
+CBR_BASE_URL = os.environ.get('CBR_BASE_URL', 'https://www.cbr.ru/eng/')
 CBR_CURRENCY_RATE_URL = f'{CBR_BASE_URL}currency_base/daily/'
 CBR_KEY_INDICATORS_URL = f'{CBR_BASE_URL}key-indicators/'
+CBR_REQUEST_TIMEOUT = (3.05, 10)
+CBR_POOL_SIZE = 8
 JSON_DAILY_ROUTE = '/cbr/daily'
 JSON_KEY_INDICATORS_ROUTE = '/cbr/key_indicators'
 LOGGING_CONFIG_YAML_FILE_PATH = 'logging.config.yml'
+ASSET_BULK_ROW_FIELDS = ('char_code', 'name', 'capital', 'interest')
+ASSET_STREAM_CHUNK_SIZE = 1_000
+ASSET_STREAM_MIMETYPES = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+REVENUE_CURVE_MAX_PERIODS = 1_000_000
+REVENUE_CURVE_STREAM_MIN_PERIODS = 1_000
+RATE_CACHE_TTL = 60 * 60
+RATE_CACHE_STALE_TTL = 6 * 60 * 60
+RATE_CACHE_STATS_ROUTE = '/cbr/cache_stats'
+RATE_REFRESHER_ENABLED = os.environ.get('RATE_REFRESHER_ENABLED', '0') == '1'
+RATE_REFRESH_INTERVAL = 15 * 60
+RATE_REFRESH_RETRY_DELAY = 5
+RATE_REFRESH_MAX_BACKOFF = 10 * 60
+REVENUE_PROCESS_CNT = int(os.environ.get('REVENUE_PROCESS_CNT', '0'))
+ASSET_STORE_PATH = os.environ.get('ASSET_STORE_PATH')
+ASSET_STORE_SQLITE_PATH = os.environ.get('ASSET_STORE_SQLITE_PATH')
+RESPONSE_COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION_ENABLED', '0') == '1'
+RESPONSE_COMPRESSION_MIN_SIZE = 4 * 1024
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0') == '1'
+METRICS_ROUTE = '/metrics'
+REQUEST_DURATION_METRIC = 'asset_web_service_request_duration_seconds'
+STAGE_DURATION_METRIC = 'asset_web_service_stage_duration_seconds'
 
-with open(LOGGING_CONFIG_YAML_FILE_PATH) as config_fin:
-    logging.config.dictConfig(yaml.safe_load(config_fin))
+CBR_DAILY_ROW_XPATH = "//table[@class='data']//tr[td]"
+CBR_KEY_INDICATOR_ROW_XPATH = '//div[@class="dropdown"][1]//tr[.//div[@class="col-md-3 offset-md-1 _subinfo"]]'
+CBR_KEY_INDICATOR_CODE_XPATH = './/div[@class="col-md-3 offset-md-1 _subinfo"]/text()'
+CBR_KEY_INDICATOR_VALUE_XPATH = 'td[@class="value td-w-4 _bold _end mono-num"]/text()'
+
+
+class CBRServiceUnavailableError(Exception):
+    """Raised when cbr.ru replies with error status code"""
+
+
+class AssetValidationError(Exception):
+    """Raised when asset can not be added, status_code is http code to reply with"""
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+RateCacheEntry = namedtuple('RateCacheEntry', ['value', 'loaded_at'])
+RateSnapshot = namedtuple('RateSnapshot', ['collections', 'loaded_at'])
+CBRPage = namedtuple('CBRPage', ['collection', 'etag', 'last_modified'])
+CBRXPaths = namedtuple('CBRXPaths', ['daily_row', 'key_indicator_row', 'key_indicator_code', 'key_indicator_value'])
+
+
+class RateSnapshotCache:
+    """
+    Thread-safe cache of parsed cbr.ru pages keyed by url.
+    Entry younger than ttl is served as is, entry younger than ttl + stale_ttl
+    is served stale while it is reloaded in background thread
+    """
+    def __init__(self, ttl: float, stale_ttl: float = 0.0, clock=time.monotonic):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._revalidating = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def get(self, url: str, loader) -> dict:
+        """
+        Return parsed page for url, call loader(url) on miss
+        :raise CBRServiceUnavailableError: if there is no usable entry and loader failed
+        """
+        value = self.get_cached(url, loader)
+        if value is None:
+            value = self.load(url, loader)
+
+        return value
+
+    def get_cached(self, url: str, loader) -> Optional[dict]:
+        """
+        Return parsed page for url if it is cached, stale page is reloaded by loader(url) in background thread
+        :return: parsed page or None on miss
+        """
+        value, revalidate = self.lookup(url)
+        if revalidate:
+            threading.Thread(target=self._revalidate, args=(url, loader), daemon=True).start()
+
+        return value
+
+    def load(self, url: str, loader) -> dict:
+        """
+        Load page missed in cache by loader(url) and put it into cache
+        :raise CBRServiceUnavailableError: if loader failed
+        """
+        value = loader(url)
+        self.put(url, value)
+
+        return value
+
+    def lookup(self, url: str) -> tuple:
+        """
+        Find usable entry for url without loading it
+        :return: (parsed page or None on miss, flag if caller has to reload stale page and put it back)
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            age = None if entry is None else self._clock() - entry.loaded_at
+            if entry is not None and age < self.ttl:
+                self.hits += 1
+                return entry.value, False
+
+            if entry is not None and age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                revalidate = url not in self._revalidating
+                self._revalidating.add(url)
+                return entry.value, revalidate
+
+            self.misses += 1
+            return None, False
+
+    def put(self, url: str, value: dict) -> None:
+        with self._lock:
+            self._entries[url] = RateCacheEntry(value, self._clock())
+            self._revalidating.discard(url)
+
+    def cancel_revalidation(self, url: str) -> None:
+        """Let next caller reload stale page after failed reload"""
+        with self._lock:
+            self._revalidating.discard(url)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.stale_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = self._clock()
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'age': {url: round(now - entry.loaded_at, 3) for url, entry in self._entries.items()},
+            }
+
+    def _revalidate(self, url: str, loader) -> None:
+        try:
+            self.put(url, loader(url))
+        except CBRServiceUnavailableError as error:
+            app.logger.warning('failed to revalidate cached page %s: %s', url, error)
+        except Exception:
+            app.logger.exception('failed to parse revalidated page %s', url)
+        finally:
+            # put has not run if loader failed, so the next stale hit reloads page again
+            self.cancel_revalidation(url)
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time: callers coming while the call is in flight
+    do not run it again but wait for it and share its result (or exception)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, function, *args):
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self._in_flight[key] = Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = function(*args)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._in_flight)}
+
+
+class RateRefresher(threading.Thread):
+    """
+    Daemon thread keeping parsed cbr.ru pages up to date.
+    Every refresh publishes new RateSnapshot by rebinding snapshot attribute,
+    published snapshot is never mutated, so handlers read it without locks
+    """
+    def __init__(
+            self,
+            url_list: list,
+            loader,
+            interval: float = RATE_REFRESH_INTERVAL,
+            retry_delay: float = RATE_REFRESH_RETRY_DELAY,
+            max_backoff: float = RATE_REFRESH_MAX_BACKOFF,
+    ):
+        super().__init__(name='cbr-rate-refresher', daemon=True)
+        self.url_list = url_list
+        self.loader = loader
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self.snapshot = None
+        self.failures = 0
+        self._stop_event = threading.Event()
+
+    def refresh(self) -> None:
+        """
+        Load all pages and publish new snapshot, pages failed to load or parse keep previous values
+        :raise CBRServiceUnavailableError: if any page failed to load or parse
+        """
+        collections = dict(self.snapshot.collections) if self.snapshot else {}
+        error = None
+        future_list = [cbr_executor.submit(self.loader, url) for url in self.url_list]
+        for url, future in zip(self.url_list, future_list):
+            try:
+                collections[url] = future.result()
+            except CBRServiceUnavailableError as url_error:
+                app.logger.warning('failed to refresh %s: %s', url, url_error)
+                error = url_error
+            except Exception as url_error:
+                # e.g. page markup has been changed, refresher keeps running and retries it with backoff
+                app.logger.exception('failed to parse refreshed %s', url)
+                error = url_error
+
+        self.snapshot = RateSnapshot(collections, time.time())
+        if error is not None:
+            raise CBRServiceUnavailableError(str(error))
+
+    def backoff_delay(self) -> float:
+        """Exponential delay before next attempt after failure with full jitter"""
+        delay = min(self.max_backoff, self.retry_delay * 2 ** (self.failures - 1))
+        return random.uniform(delay / 2, delay)
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+                self.failures = 0
+                delay = self.interval
+            except CBRServiceUnavailableError:
+                self.failures += 1
+                delay = self.backoff_delay()
+            except Exception:
+                app.logger.exception('rate refresh failed')
+                self.failures += 1
+                delay = self.backoff_delay()
+
+            self._stop_event.wait(delay)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        return {
+            'failures': self.failures,
+            'age': None if snapshot is None else round(time.time() - snapshot.loaded_at, 3),
+        }
+
+
+def create_asset_store() -> CompositeAssetItem:
+    """
+    Create store of assets: shared by all worker processes through ASSET_STORE_SQLITE_PATH database
+    if it is set, kept on disk in ASSET_STORE_PATH directory if it is set (log is compacted
+    into snapshot at exit), otherwise in process memory only
+    """
+    process_pool = None
+    if REVENUE_PROCESS_CNT:
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+
+        # workers are started on the first revenue request, when request, cbr fetch and logging threads
+        # are already running, forking such process may deadlock, so they are started by fork server
+        process_pool = ProcessPoolExecutor(REVENUE_PROCESS_CNT, mp_context=multiprocessing.get_context('forkserver'))
+    if ASSET_STORE_SQLITE_PATH is not None:
+        return SQLiteAssetStore(
+            name='asset_composite',
+            path=ASSET_STORE_SQLITE_PATH,
+            process_pool=process_pool,
+            shard_cnt=REVENUE_PROCESS_CNT or 1
+        )
+    if ASSET_STORE_PATH is None:
+        return CompositeAssetItem(name='asset_composite', process_pool=process_pool, shard_cnt=REVENUE_PROCESS_CNT or 1)
+
+    store = PersistentAssetStore(
+        name='asset_composite',
+        path=ASSET_STORE_PATH,
+        process_pool=process_pool,
+        shard_cnt=REVENUE_PROCESS_CNT or 1
+    )
+    atexit.register(store.close)
+
+    return store
+
+
+def create_metrics_registry() -> MetricsRegistry:
+    """Registry of request duration per route and duration of stages of request handling"""
+    metrics = MetricsRegistry(enabled=METRICS_ENABLED)
+    metrics.declare(REQUEST_DURATION_METRIC, 'route', 'Duration of request handling per route')
+    metrics.declare(
+        STAGE_DURATION_METRIC,
+        'stage',
+        'Duration of cbr.ru fetch, cbr.ru page parse, revenue calculation and json serialization'
+    )
+
+    return metrics
+
+
+def create_cbr_session():
+    """requests session with pool of keep-alive connections to cbr.ru"""
+    from requests.adapters import HTTPAdapter
+
+    session = get_lazy_attribute('requests').Session()
+    session.mount(CBR_BASE_URL, HTTPAdapter(pool_connections=2, pool_maxsize=CBR_POOL_SIZE))
+
+    return session
+
+
+def compile_cbr_xpaths() -> CBRXPaths:
+    etree = get_lazy_attribute('etree')
+
+    return CBRXPaths(
+        etree.XPath(CBR_DAILY_ROW_XPATH),
+        etree.XPath(CBR_KEY_INDICATOR_ROW_XPATH),
+        etree.XPath(CBR_KEY_INDICATOR_CODE_XPATH),
+        etree.XPath(CBR_KEY_INDICATOR_VALUE_XPATH),
+    )
+
+
+# module attributes made on first use: requests (with urllib3 and certifi) and lxml take longer to import
+# than flask, and worker serving asset routes from cached rates may never need them
+LAZY_ATTRIBUTE_LOADERS = {
+    'requests': partial(importlib.import_module, 'requests'),
+    'cbr_session': create_cbr_session,
+    'etree': partial(importlib.import_module, 'lxml.etree'),
+    'cbr_xpaths': compile_cbr_xpaths,
+}
+_lazy_attribute_lock = threading.RLock()
+_app_setup_lock = threading.Lock()
+
+
+def get_lazy_attribute(name: str):
+    """:return: value of module attribute listed in LAZY_ATTRIBUTE_LOADERS, loaded once on the first call"""
+    value = globals().get(name)
+    if value is None:
+        with _lazy_attribute_lock:
+            value = globals().get(name)
+            if value is None:
+                value = globals()[name] = LAZY_ATTRIBUTE_LOADERS[name]()
+
+    return value
+
+
+def __getattr__(name: str):
+    """Lazy attributes are available as module attributes too, e.g. from asset_web_service import cbr_session"""
+    if name not in LAZY_ATTRIBUTE_LOADERS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    return get_lazy_attribute(name)
+
+
+cbr_executor = ThreadPoolExecutor(max_workers=CBR_POOL_SIZE, thread_name_prefix='cbr-fetch')
+cbr_page_collection = {}
 
 app = Flask(__name__)
-app.bank = CompositeAssetItem(name='asset_composite')
+app.json = FastJSONProvider(app)
+app.response_compression_min_size = RESPONSE_COMPRESSION_MIN_SIZE if RESPONSE_COMPRESSION_ENABLED else None
+app.bank = create_asset_store()
+app.rate_cache = RateSnapshotCache(RATE_CACHE_TTL, RATE_CACHE_STALE_TTL)
+app.rate_refresher = None
+app.asset_list_cache = None
+app.revenue_cache = RevenueCache()
+app.cbr_single_flight = SingleFlight()
+app.metrics = create_metrics_registry()
+app.is_set_up = False
+
+
+def create_app(logging_config_path: str = LOGGING_CONFIG_YAML_FILE_PATH) -> Flask:
+    """
+    Application factory for WSGI servers: configure logging (from cached config, log files are opened
+    on the first record) and start background refresher of cbr.ru pages if it is enabled.
+    Set up is done once per process, app is set up on the first request if it is served without factory
+    """
+    with _app_setup_lock:
+        if not app.is_set_up:
+            configure_logging(load_logging_config(logging_config_path))
+            if RATE_REFRESHER_ENABLED:
+                start_rate_refresher()
+            app.is_set_up = True
+
+    return app
+
+
+@app.before_request
+def set_up_app():
+    if not app.is_set_up:
+        create_app()
+
+
+@app.before_request
+def sync_asset_store():
+    """Requests see assets added by other worker processes if store is shared between them"""
+    app.bank.sync()
+
+
+@app.before_request
+def start_request_timer():
+    if app.metrics.enabled:
+        g.request_started_at = time.perf_counter()
+
+
+@app.after_request
+def observe_request_duration(response):
+    if app.metrics.enabled and 'request_started_at' in g:
+        route = request.url_rule.rule if request.url_rule is not None else 'not_found'
+        app.metrics.observe(REQUEST_DURATION_METRIC, route, time.perf_counter() - g.request_started_at)
+
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Compress large response bodies if client accepts gzip or brotli (runs before request duration is observed)"""
+    # file responses are passed through as is, body is read only if it is going to be compressed
+    if not is_compressible(response, response.is_streamed or response.direct_passthrough):
+        return response
+
+    encoding = choose_encoding(
+        request.accept_encodings, response.calculate_content_length(), app.response_compression_min_size
+    )
+    if encoding is not None:
+        with app.metrics.timer(STAGE_DURATION_METRIC, 'compression'):
+            set_compressed_body(response, compress(response.get_data(), encoding), encoding)
+
+    return response
 
 
 @app.route(f'{API_ROUTE}/calculate_revenue')
 def calc_assets_revenue():
     """
-    Provides path to calculate total revenue for web_service
+    Provides path to calculate total revenue for web_service, periods are listed as period=N
+    or given as range by period_from, period_to and optional step (curves of
+    REVENUE_CURVE_STREAM_MIN_PERIODS periods and more are streamed)
     :return: total revenue for all assets behind all periods provided (in json)
     """
     app.logger.info('called "%s/calculate_revenue" route', API_ROUTE)
 
-    response = requests.get(CBR_KEY_INDICATORS_URL)
-    if response.status_code >= 400:
-        abort(503)
-        app.logger.error(
-            '%s service is unavailable now, get request status code: %s',
-            CBR_KEY_INDICATORS_URL,
-            response.status_code
-        )
+    period_range = parse_revenue_period_range(request.args)
+    key_indicators_col, currency_rate_col = get_cbr_collections(CBR_KEY_INDICATORS_URL, CBR_CURRENCY_RATE_URL)
+    if period_range is not None:
+        try:
+            curve = app.bank.iter_revenue_curve(period_range, key_indicators_col, currency_rate_col)
+        except OverflowError as error:
+            app.logger.warning('revenue curve is rejected, %s', error)
+            abort(400)
 
-    app.logger.debug(
-        'get request has sent to %s, status code: %s',
-        CBR_KEY_INDICATORS_URL,
-        response.status_code
-    )
+        if len(period_range) >= REVENUE_CURVE_STREAM_MIN_PERIODS:
+            return Response(generate_revenue_curve_chunks(curve), mimetype='application/json')
 
-    key_indicators_col = parse_cbr_key_indicators_html(response.text)
+        with app.metrics.timer(STAGE_DURATION_METRIC, 'revenue_calculation'):
+            result = {str(period): revenue for chunk in curve for period, revenue in chunk}
+        with app.metrics.timer(STAGE_DURATION_METRIC, 'json_serialization'):
+            return jsonify(result)
 
-    response = requests.get(CBR_CURRENCY_RATE_URL)
-    if response.status_code >= 400:
-        abort(503)
-        app.logger.error(
-            '%s service is unavailable now, get request status code: %s',
-            CBR_CURRENCY_RATE_URL,
-            response.status_code
-        )
-
-    app.logger.debug('get request has sent to %s, status code: %s', CBR_CURRENCY_RATE_URL, response.status_code)
-
-    currency_rate_col = parse_cbr_currency_daily_html(response.text)
     period_list = list(map(lambda x: abs(int(x)), request.args.getlist('period')))
-    result = app.bank.calculate_revenue(period_list, key_indicators_col, currency_rate_col)
+    with app.metrics.timer(STAGE_DURATION_METRIC, 'revenue_calculation'):
+        result = app.revenue_cache.calculate_revenue(app.bank, period_list, key_indicators_col, currency_rate_col)
 
-    return jsonify(result)
+    with app.metrics.timer(STAGE_DURATION_METRIC, 'json_serialization'):
+        return jsonify(result)
 
 
 @app.route(f'{API_ROUTE}/get')
@@ -78,17 +533,21 @@ def get_asset_list_with_provided_names():
     """
     app.logger.info('called "%s/get" route', API_ROUTE)
     name_list = request.args.getlist('name')
+    paged_response = make_paged_asset_list_response(name_list)
+    if paged_response is not None:
+        return paged_response
+
     result = app.bank.get_asset_list(name_list)
 
-    return jsonify(result)
+    with app.metrics.timer(STAGE_DURATION_METRIC, 'json_serialization'):
+        return jsonify(result)
 
 
 @app.route(f'{API_ROUTE}/cleanup')
 def clean_asset_list():
     """Provides path to clean all assets stored"""
     app.logger.info('called "%s/cleanup" route', API_ROUTE)
-    del app.bank
-    app.bank = CompositeAssetItem(name='asset_composite')
+    app.bank.clear()
 
     return 'assets list has been cleaned', 200
 
@@ -100,9 +559,27 @@ def get_asset_list():
     :return: list of all assets stored (in json)
     """
     app.logger.info('called "%s/list" route, run get_asset_list function', API_ROUTE)
-    result = app.bank.get_asset_list()
+    paged_response = make_paged_asset_list_response()
+    if paged_response is not None:
+        return paged_response
 
-    return jsonify(result)
+    version = app.bank.version
+    cache = app.asset_list_cache
+    if cache is None or cache[0] != version:
+        asset_list = app.bank.get_asset_list()
+        with app.metrics.timer(STAGE_DURATION_METRIC, 'json_serialization'):
+            cache = app.asset_list_cache = (version, jsonify(asset_list).get_data(), {})
+
+    response = app.response_class(cache[1], mimetype='application/json')
+    encoding = choose_encoding(request.accept_encodings, len(cache[1]), app.response_compression_min_size)
+    if encoding is not None:
+        compressed_body = cache[2].get(encoding)
+        if compressed_body is None:
+            with app.metrics.timer(STAGE_DURATION_METRIC, 'compression'):
+                compressed_body = cache[2][encoding] = compress(cache[1], encoding)
+        set_compressed_body(response, compressed_body, encoding)
+
+    return response
 
 
 @app.route(f'{API_ROUTE}/add/<char_code>/<name>/<capital>/<interest>')
@@ -117,23 +594,33 @@ def add_asset_item(char_code, name, capital, interest):
         interest
     )
 
-    capital = float(capital)
-    interest = float(interest)
-    if app.bank.get_asset_list(name_list=[name]):
-        abort(403)
-        app.logger.warning('asset with name %s has already existed', name)
-
-    if interest <= 0 or interest >= 1 or capital <= 0:
-        abort(400)
-        app.logger.warning('bad values for %s or %s', interest, capital)
-
-    app.bank.add(AssetItem(name, char_code, capital, interest))
+    try:
+        add_new_asset_item(app.bank, char_code, name, capital, interest)
+    except AssetValidationError as error:
+        app.logger.warning('asset %s was not added: %s', name, error)
+        abort(error.status_code)
 
     app.logger.info('asset %s was successfully added', name)
 
     return f'Asset {name} was successfully added.', 200
 
 
+@app.route(f'{API_ROUTE}/bulk_add', methods=['POST'])
+def bulk_add_asset_items():
+    """
+    Provides path to add many assets at once. Body is json array, ndjson or csv (depends on Content-Type)
+    of rows [char_code, name, capital, interest] (or json objects with such keys).
+    Rows are validated the same way as in add route, valid rows are added, invalid ones are reported
+    :return: number of added assets and list of errors per row (in json)
+    """
+    app.logger.info('called "%s/bulk_add" route', API_ROUTE)
+    numbered_row_list = parse_bulk_asset_rows(request.mimetype, request.get_data(as_text=True))
+    result = bulk_add_asset_rows(app.bank, numbered_row_list)
+    app.logger.info('%s assets were added, %s rows were rejected', result['added'], len(result['errors']))
+
+    return jsonify(result)
+
+
 @app.route(JSON_DAILY_ROUTE)
 def get_currency_rate_collection():
     """
@@ -141,24 +628,9 @@ def get_currency_rate_collection():
     :return: currency index (in json)
     """
     app.logger.info('called "%s" route', JSON_DAILY_ROUTE)
-    response = requests.get(CBR_CURRENCY_RATE_URL)
-    app.logger.debug(
-        'get request has sent to %s, status code: %s',
-        CBR_CURRENCY_RATE_URL,
-        response.status_code
-    )
-
-    if response.status_code >= 400:
-        app.logger.error(
-            '%s service is unavailable now, get request status code: %s',
-            CBR_CURRENCY_RATE_URL,
-            response.status_code
-        )
-        abort(503)
+    currency_index = get_cbr_collection(CBR_CURRENCY_RATE_URL)
 
-    currency_index = parse_cbr_currency_daily_html(response.text)
-
-    return jsonify(currency_index)
+    return make_conditional_json_response(currency_index)
 
 
 @app.route(JSON_KEY_INDICATORS_ROUTE)
@@ -168,32 +640,450 @@ def get_key_indicator_collection():
     :return: currency index (in json)
     """
     app.logger.info('called "%s" route', JSON_KEY_INDICATORS_ROUTE)
-    response = requests.get(CBR_KEY_INDICATORS_URL)
-    app.logger.debug('get request has sent to %s, status code: %s', CBR_KEY_INDICATORS_URL, response.status_code)
+    key_indicator_collection = get_cbr_collection(CBR_KEY_INDICATORS_URL)
 
-    if response.status_code >= 400:
-        app.logger.error(
-            '%s service is unavailable now, get request status code: %s',
-            CBR_KEY_INDICATORS_URL,
-            response.status_code
-        )
-        abort(503)
+    return make_conditional_json_response(key_indicator_collection)
+
+
+@app.route(RATE_CACHE_STATS_ROUTE)
+def get_rate_cache_stats():
+    """
+    Provides path to get cbr.ru pages cache counters
+    :return: hits, misses and age of cached pages, number of coalesced cbr.ru requests
+        and revenue cache counters (in json)
+    """
+    app.logger.info('called "%s" route', RATE_CACHE_STATS_ROUTE)
+    stats = app.rate_cache.stats()
+    stats['single_flight'] = app.cbr_single_flight.stats()
+    stats['revenue_cache'] = app.revenue_cache.stats()
+    if app.rate_refresher is not None:
+        stats['refresher'] = app.rate_refresher.stats()
+
+    return jsonify(stats)
 
-    key_indicator_collection = parse_cbr_key_indicators_html(response.text)
 
-    return jsonify(key_indicator_collection)
+@app.route(METRICS_ROUTE)
+def get_metrics():
+    """
+    Provides path to get request and stage duration histograms (if METRICS_ENABLED is set)
+    :return: metrics in Prometheus text format
+    """
+    return Response(app.metrics.render(), content_type=METRICS_CONTENT_TYPE)
 
 
 @app.errorhandler(404)
-def page_not_found():
+def page_not_found(error):
     return render_template('page_not_found.html'), 404
 
 
 @app.errorhandler(503)
-def page_not_found():
+def cbr_service_unavailable(error):
     return 'CBR service is unavailable', 503
 
 
+def build_asset_item(
+        bank: CompositeAssetItem,
+        char_code: str,
+        name: str,
+        capital,
+        interest,
+        reserved_name_set=frozenset()
+) -> AssetItem:
+    """
+    Validate asset values and build asset item to be added to bank
+    :param reserved_name_set: names that are not stored yet but have been already taken
+    :raise AssetValidationError: 403 if name already exists, 400 for bad values of capital or interest
+    """
+    if name in bank or name in reserved_name_set:
+        raise AssetValidationError(403, f'asset with name {name} has already existed')
+
+    try:
+        capital = float(capital)
+        interest = float(interest)
+    except (TypeError, ValueError):
+        raise AssetValidationError(400, f'bad values for {interest} or {capital}')
+
+    if interest <= 0 or interest >= 1 or capital <= 0:
+        raise AssetValidationError(400, f'bad values for {interest} or {capital}')
+
+    return AssetItem(name, char_code, capital, interest)
+
+
+def add_new_asset_item(bank: CompositeAssetItem, char_code: str, name: str, capital, interest) -> None:
+    """
+    Validate asset and add it to bank unless its name is taken. Name is checked again
+    by atomic conditional insert, so concurrent requests can not add the same name twice
+    :raise AssetValidationError: 403 if name already exists, 400 for bad values of capital or interest
+    """
+    asset_item = build_asset_item(bank, char_code, name, capital, interest)
+    if not bank.add_if_absent(asset_item):
+        raise AssetValidationError(403, f'asset with name {name} has already existed')
+
+
+def parse_bulk_asset_rows(mimetype: str, body: str) -> list:
+    """
+    Parse body of bulk add request into list of rows numbered by index in json array,
+    by line of ndjson body (blank lines are skipped but counted) or by index of csv row after header.
+    Malformed ndjson line is not parsed, AssetValidationError is kept instead of its row
+    :return: list of (row number, row as it is in body (list or dict) or AssetValidationError)
+    """
+    if mimetype == 'application/json':
+        try:
+            row_list = json.loads(body)
+        except ValueError:
+            abort(400)
+        if not isinstance(row_list, list):
+            abort(400)
+        return list(enumerate(row_list))
+
+    if mimetype == 'application/x-ndjson':
+        numbered_row_list = []
+        for line_number, line in enumerate(body.splitlines()):
+            if not line.strip():
+                continue
+            try:
+                numbered_row_list.append((line_number, json.loads(line)))
+            except ValueError as error:
+                numbered_row_list.append((line_number, AssetValidationError(400, f'bad json line: {error}')))
+        return numbered_row_list
+
+    if mimetype == 'text/csv':
+        row_list = [row for row in csv.reader(io.StringIO(body)) if row]
+        if row_list and tuple(row_list[0]) == ASSET_BULK_ROW_FIELDS:
+            row_list.pop(0)
+        return list(enumerate(row_list))
+
+    abort(415)
+
+
+def bulk_add_asset_rows(bank: CompositeAssetItem, numbered_row_list: list) -> dict:
+    """
+    Validate rows numbered by parse_bulk_asset_rows and add valid ones to bank in one pass
+    :return: number of added assets and list of errors per row
+    """
+    asset_item_list = []
+    asset_row_number_list = []
+    error_list = []
+    new_name_set = set()
+    for row_number, row in numbered_row_list:
+        try:
+            if isinstance(row, AssetValidationError):
+                raise row
+            asset_item = build_asset_item(bank, *normalize_bulk_asset_row(row), reserved_name_set=new_name_set)
+        except AssetValidationError as error:
+            error_list.append({'row': row_number, 'status_code': error.status_code, 'message': str(error)})
+            continue
+
+        new_name_set.add(asset_item.name)
+        asset_item_list.append(asset_item)
+        asset_row_number_list.append(row_number)
+
+    # names taken by concurrent requests after validation are rejected by conditional insert
+    rejected_index_list = bank.add_many_if_absent(asset_item_list)
+    for index in rejected_index_list:
+        error_list.append({
+            'row': asset_row_number_list[index],
+            'status_code': 403,
+            'message': f'asset with name {asset_item_list[index].name} has already existed',
+        })
+    error_list.sort(key=lambda error: error['row'])
+
+    return {'added': len(asset_item_list) - len(rejected_index_list), 'errors': error_list}
+
+
+def normalize_bulk_asset_row(row) -> tuple:
+    """
+    :raise AssetValidationError: if row has no char_code, name, capital and interest
+    :return: (char_code, name, capital, interest)
+    """
+    if isinstance(row, dict):
+        row = [row.get(field) for field in ASSET_BULK_ROW_FIELDS]
+
+    if not isinstance(row, list) or len(row) != len(ASSET_BULK_ROW_FIELDS) or not all(
+            isinstance(value, str) for value in row[:2]
+    ):
+        raise AssetValidationError(400, f'row should consist of {", ".join(ASSET_BULK_ROW_FIELDS)}')
+
+    return tuple(row)
+
+
+def make_paged_asset_list_response(name_list: Optional[list] = None) -> Optional[Response]:
+    """
+    Build response for asset list requested with limit, cursor or stream query arguments.
+    Page is returned as {"assets": [...], "next_cursor": "..."}, stream is returned
+    as json array or ndjson chunks read from store page by page
+    :return: response or None if list is requested as a whole
+    """
+    page_args = parse_asset_page_args(request.args)
+    if page_args is None:
+        return None
+
+    limit, after, stream_format = page_args
+    if stream_format is not None:
+        return Response(
+            generate_asset_list_chunks(app.bank, name_list, after, stream_format, ASSET_STREAM_CHUNK_SIZE),
+            mimetype=ASSET_STREAM_MIMETYPES[stream_format]
+        )
+
+    asset_page = get_asset_page(app.bank, name_list, after, limit)
+    with app.metrics.timer(STAGE_DURATION_METRIC, 'json_serialization'):
+        return jsonify(asset_page)
+
+
+def parse_revenue_period_range(args) -> Optional[range]:
+    """
+    Parse and validate period_from, period_to and step query arguments
+    :return: range of periods from period_from to period_to inclusive or None if range is not provided
+    """
+    period_from = args.get('period_from', type=int)
+    period_to = args.get('period_to', type=int)
+    # step which is not an integer is rejected below instead of falling back to default step
+    step = args.get('step', type=int) if 'step' in args else 1
+    if 'period_from' not in args and 'period_to' not in args:
+        return None
+
+    if period_from is None or period_to is None or 'period' in args:
+        abort(400)
+
+    if period_from < 0 or period_to < period_from or step is None or step <= 0:
+        abort(400)
+
+    period_range = range(period_from, period_to + 1, step)
+    if len(period_range) > REVENUE_CURVE_MAX_PERIODS:
+        abort(400)
+
+    return period_range
+
+
+def generate_revenue_curve_chunks(curve):
+    """Yield json object {period: revenue} by chunks of revenue curve, periods keep their order"""
+    yield '{'
+    separator = ''
+    for chunk in curve:
+        yield separator + ','.join(f'"{period}":{json_provider.dumps(revenue)}' for period, revenue in chunk)
+        separator = ','
+    yield '}'
+
+
+def parse_asset_page_args(args) -> Optional[tuple]:
+    """
+    Parse and validate limit, cursor and stream query arguments
+    :return: (limit, key to start after, stream format) or None if none of arguments provided
+    """
+    limit = args.get('limit', type=int)
+    cursor = args.get('cursor')
+    stream_format = args.get('stream')
+    if limit is None and cursor is None and stream_format is None:
+        return None
+
+    if limit is not None and limit <= 0:
+        abort(400)
+
+    if stream_format is not None and stream_format not in ASSET_STREAM_MIMETYPES:
+        abort(400)
+
+    after = decode_asset_cursor(cursor) if cursor else None
+
+    return limit, after, stream_format
+
+
+def get_asset_page(
+        bank: CompositeAssetItem,
+        name_list: Optional[list],
+        after: Optional[tuple],
+        limit: Optional[int]
+) -> dict:
+    """:return: page of assets and cursor of the next page (None for the last page)"""
+    asset_list = bank.get_asset_list(name_list, after=after, limit=limit)
+    next_cursor = None
+    if limit is not None and len(asset_list) == limit:
+        next_cursor = encode_asset_cursor(asset_list[-1])
+
+    return {'assets': asset_list, 'next_cursor': next_cursor}
+
+
+def encode_asset_cursor(asset: list) -> str:
+    """Opaque cursor pointing after asset, based on its (char_code, name) key"""
+    return base64.urlsafe_b64encode(json.dumps(asset[:2]).encode()).decode()
+
+
+def decode_asset_cursor(cursor: str) -> tuple:
+    """:return: (char_code, name) key encoded in cursor, request is aborted with 400 if cursor is malformed"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        abort(400)
+
+    if not isinstance(key, list) or len(key) != 2 or not all(isinstance(part, str) for part in key):
+        abort(400)
+
+    return tuple(key)
+
+
+def generate_asset_list_chunks(
+        bank: CompositeAssetItem,
+        name_list: Optional[list],
+        after: Optional[tuple],
+        stream_format: str,
+        chunk_size: int
+):
+    """
+    Yield asset list serialized by chunks of chunk_size assets,
+    so memory used does not depend on store size
+    """
+    if stream_format == 'json':
+        yield '['
+
+    is_first_chunk = True
+    while True:
+        asset_list = bank.get_asset_list(name_list, after=after, limit=chunk_size)
+        if not asset_list:
+            break
+
+        if stream_format == 'json':
+            yield ('' if is_first_chunk else ',') + ','.join(map(json_provider.dumps, asset_list))
+        else:
+            yield ''.join(json_provider.dumps(asset) + '\n' for asset in asset_list)
+
+        is_first_chunk = False
+        after = asset_list[-1][:2]
+        if len(asset_list) < chunk_size:
+            break
+
+    if stream_format == 'json':
+        yield ']'
+
+
+def make_conditional_json_response(collection: dict) -> Response:
+    """Json response with ETag derived from its content, replies 304 if client already has it"""
+    response = jsonify(collection)
+    response.add_etag()
+
+    return response.make_conditional(request)
+
+
+def get_cbr_collection(url: str) -> dict:
+    """
+    Get parsed cbr.ru page, abort with 503 if cbr.ru is unavailable
+    :return: parsed page as dict
+    """
+    return get_cbr_collections(url)[0]
+
+
+def get_cbr_collections(*url_list) -> list:
+    """
+    Get parsed cbr.ru pages from background refresher snapshot if it is started
+    or from rate cache otherwise. Cached pages are taken in calling thread,
+    only pages missed in cache are fetched (concurrently if there are several of them).
+    Abort with 503 if cbr.ru is unavailable
+    :return: list of parsed pages as dicts in the order of urls provided
+    """
+    if app.rate_refresher is not None:
+        snapshot = app.rate_refresher.snapshot
+        collection_list = [] if snapshot is None else [snapshot.collections.get(url) for url in url_list]
+        if snapshot is None or None in collection_list:
+            app.logger.error('%s pages have not been loaded by refresher yet', url_list)
+            abort(503)
+        return collection_list
+
+    collection_list = [app.rate_cache.get_cached(url, fetch_cbr_collection) for url in url_list]
+    missed_index_list = [index for index, collection in enumerate(collection_list) if collection is None]
+    try:
+        if len(missed_index_list) == 1:
+            index, = missed_index_list
+            collection_list[index] = app.rate_cache.load(url_list[index], fetch_cbr_collection)
+        elif missed_index_list:
+            future_list = [
+                cbr_executor.submit(app.rate_cache.load, url_list[index], fetch_cbr_collection)
+                for index in missed_index_list
+            ]
+            for index, future in zip(missed_index_list, future_list):
+                collection_list[index] = future.result()
+    except CBRServiceUnavailableError as error:
+        app.logger.error('%s service is unavailable now, %s', CBR_BASE_URL, error)
+        abort(503)
+
+    return collection_list
+
+
+def start_rate_refresher(**kwargs) -> RateRefresher:
+    """Start background refresher of cbr.ru pages, handlers stop fetching cbr.ru by themselves"""
+    app.rate_refresher = RateRefresher([CBR_KEY_INDICATORS_URL, CBR_CURRENCY_RATE_URL], fetch_cbr_collection, **kwargs)
+    app.rate_refresher.start()
+
+    return app.rate_refresher
+
+
+def fetch_cbr_collection(url: str) -> dict:
+    """
+    Fetch and parse cbr.ru page, concurrent callers for the same url share one request
+    :raise CBRServiceUnavailableError: if cbr.ru is unreachable or replies with error status code
+    :return: parsed page as dict
+    """
+    return app.cbr_single_flight.do(url, load_cbr_collection, url)
+
+
+def load_cbr_collection(url: str) -> dict:
+    """
+    Fetch and parse cbr.ru page. ETag and Last-Modified of the last parsed page are sent back
+    to cbr.ru, so page which has not been modified is neither downloaded nor parsed again
+    :raise CBRServiceUnavailableError: if cbr.ru is unreachable or replies with error status code
+    :return: parsed page as dict
+    """
+    try:
+        with app.metrics.timer(STAGE_DURATION_METRIC, 'cbr_fetch'):
+            response = get_lazy_attribute('cbr_session').get(
+                url, timeout=CBR_REQUEST_TIMEOUT, headers=make_conditional_cbr_headers(url)
+            )
+    except get_lazy_attribute('requests').RequestException as error:
+        raise CBRServiceUnavailableError(str(error)) from error
+
+    return process_cbr_response(url, response)
+
+
+def make_conditional_cbr_headers(url: str) -> dict:
+    """:return: If-None-Match and If-Modified-Since headers for the last parsed page of url"""
+    previous_page = cbr_page_collection.get(url)
+    headers = {}
+    if previous_page is not None and previous_page.etag:
+        headers['If-None-Match'] = previous_page.etag
+    if previous_page is not None and previous_page.last_modified:
+        headers['If-Modified-Since'] = previous_page.last_modified
+
+    return headers
+
+
+def process_cbr_response(url: str, response) -> dict:
+    """
+    Parse cbr.ru page response, reuse the last parsed page if it has not been modified
+    :param response: requests or httpx response
+    :raise CBRServiceUnavailableError: if cbr.ru replies with error status code
+    :return: parsed page as dict
+    """
+    app.logger.debug('get request has sent to %s, status code: %s', url, response.status_code)
+
+    previous_page = cbr_page_collection.get(url)
+    if response.status_code == 304 and previous_page is not None:
+        return previous_page.collection
+
+    if response.status_code >= 400:
+        raise CBRServiceUnavailableError(f'get request status code: {response.status_code}')
+
+    parse_function = {
+        CBR_CURRENCY_RATE_URL: parse_cbr_currency_daily_html,
+        CBR_KEY_INDICATORS_URL: parse_cbr_key_indicators_html,
+    }[url]
+    with app.metrics.timer(STAGE_DURATION_METRIC, 'cbr_parse'):
+        collection = parse_function(response.text)
+    cbr_page_collection[url] = CBRPage(
+        collection,
+        response.headers.get('ETag'),
+        response.headers.get('Last-Modified')
+    )
+
+    return collection
+
+
 def parse_cbr_currency_daily_html(html_document: str) -> dict:
     f"""
     Function to parse html of {CBR_CURRENCY_RATE_URL} page 
@@ -201,12 +1091,12 @@ def parse_cbr_currency_daily_html(html_document: str) -> dict:
     """
     currency_index = {}
 
-    root = etree.fromstring(html_document, etree.HTMLParser())
-    char_code_collection = root.xpath("//table[@class='data']//tr/td[2]/text()")
-    unit_cnt = root.xpath("//table[@class='data']//tr/td[3]/text()")
-    rate_collection = root.xpath("//table[@class='data']//tr/td[5]/text()")
-
-    for code, rate, cnt in zip(char_code_collection, rate_collection, unit_cnt):
+    root = get_lazy_attribute('etree').HTML(html_document)
+    for row in get_lazy_attribute('cbr_xpaths').daily_row(root):
+        cell_list = row.findall('td')
+        if len(cell_list) < 5:
+            continue
+        code, cnt, rate = cell_list[1].text, cell_list[2].text, cell_list[4].text
         currency_index[code] = round(float(rate) / float(cnt), 8)
 
     app.logger.debug('currency_index with %s items is built', len(currency_index))
@@ -220,17 +1110,14 @@ def parse_cbr_key_indicators_html(html_document: str) -> dict:
     :return: actual key indicator values as dict ("indicator": value)
     """
     key_indicator_collection = {}
+    xpaths = get_lazy_attribute('cbr_xpaths')
 
-    root = etree.fromstring(html_document, etree.HTMLParser())
-    char_code_collection = root.xpath(
-        '//div[@class="dropdown"][1]//div[@class="col-md-3 offset-md-1 _subinfo"]/text()'
-    )
-    rate_collection = root.xpath(
-        '//div[@class="dropdown"][1]//td[@class="value td-w-4 _bold _end mono-num"]/text()'
-    )
-
-    for code, rate in zip(char_code_collection, rate_collection):
-        key_indicator_collection[code] = float(rate.replace(',', ''))
+    root = get_lazy_attribute('etree').HTML(html_document)
+    for row in xpaths.key_indicator_row(root):
+        code_list = xpaths.key_indicator_code(row)
+        rate_list = xpaths.key_indicator_value(row)
+        if code_list and rate_list:
+            key_indicator_collection[code_list[0]] = float(rate_list[0].replace(',', ''))
 
     app.logger.debug('currency_index with %s items is built', len(key_indicator_collection))
 
@@ -0,0 +1,436 @@
+"""
+Asynchronous (ASGI) variant of asset web service built on Quart.
+Routes and error handlers are the same as in asset_web_service, but cbr.ru pages
+are fetched with non-blocking httpx client, so single process serves many requests
+waiting for cbr.ru at once. Run it with ASGI server, e.g.: hypercorn asset_web_service_asgi:app
+"""
+import asyncio
+import time
+
+import httpx
+from quart import Quart, Response, abort, g, jsonify, render_template, request
+from quart.json.provider import DefaultJSONProvider
+from quart.wrappers.response import DataBody
+
+from asset_web_service import app as wsgi_app
+from asset_web_service import (
+    API_ROUTE,
+    APPLICATION_NAME,
+    ASSET_STREAM_CHUNK_SIZE,
+    ASSET_STREAM_MIMETYPES,
+    AssetValidationError,
+    CBR_BASE_URL,
+    CBR_CURRENCY_RATE_URL,
+    CBR_KEY_INDICATORS_URL,
+    CBR_POOL_SIZE,
+    CBR_REQUEST_TIMEOUT,
+    CBRServiceUnavailableError,
+    JSON_DAILY_ROUTE,
+    JSON_KEY_INDICATORS_ROUTE,
+    LOGGING_CONFIG_YAML_FILE_PATH,
+    METRICS_ROUTE,
+    RATE_CACHE_STALE_TTL,
+    RATE_CACHE_STATS_ROUTE,
+    RATE_CACHE_TTL,
+    REVENUE_CURVE_STREAM_MIN_PERIODS,
+    REQUEST_DURATION_METRIC,
+    STAGE_DURATION_METRIC,
+    RateSnapshotCache,
+    add_new_asset_item,
+    bulk_add_asset_rows,
+    generate_asset_list_chunks,
+    generate_revenue_curve_chunks,
+    get_asset_page,
+    make_conditional_cbr_headers,
+    parse_asset_page_args,
+    parse_bulk_asset_rows,
+    parse_revenue_period_range,
+    process_cbr_response,
+)
+from composite_store import RevenueCache
+from compression import choose_encoding, compress, is_compressible, set_compressed_body
+from json_provider import OrjsonProviderMixin
+from logging_setup import configure_logging, load_logging_config
+from metrics import METRICS_CONTENT_TYPE
+
+
+class AsyncSingleFlight:
+    """
+    Runs at most one coroutine per key at a time: callers coming while it is in flight
+    await the same task and share its result (or exception)
+    """
+    def __init__(self):
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, coroutine_function, *args):
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._in_flight[key] = asyncio.ensure_future(coroutine_function(*args))
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._in_flight)}
+
+
+class FastJSONProvider(OrjsonProviderMixin, DefaultJSONProvider):
+    pass
+
+
+app = Quart(APPLICATION_NAME)
+app.json = FastJSONProvider(app)
+app.response_compression_min_size = wsgi_app.response_compression_min_size
+# store created on import of asset_web_service is reused, so files of persistent store are opened once per process
+app.bank = wsgi_app.bank
+# timings of parser shared with asset_web_service are observed into its registry, so it is reused too
+app.metrics = wsgi_app.metrics
+app.rate_cache = RateSnapshotCache(RATE_CACHE_TTL, RATE_CACHE_STALE_TTL)
+app.asset_list_cache = None
+app.revenue_cache = RevenueCache()
+app.cbr_client = None
+app.revalidation_task_set = set()
+app.cbr_single_flight = AsyncSingleFlight()
+
+
+@app.before_serving
+async def set_up_logging():
+    """Logging is configured once server starts serving, not on import of modules"""
+    configure_logging(load_logging_config(LOGGING_CONFIG_YAML_FILE_PATH))
+
+
+@app.before_serving
+async def open_cbr_client():
+    """Open pooled keep-alive client to cbr.ru with explicit connect and read timeouts"""
+    connect_timeout, read_timeout = CBR_REQUEST_TIMEOUT
+    app.cbr_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        limits=httpx.Limits(max_connections=CBR_POOL_SIZE, max_keepalive_connections=CBR_POOL_SIZE),
+    )
+
+
+@app.after_serving
+async def close_cbr_client():
+    await app.cbr_client.aclose()
+
+
+@app.before_request
+async def sync_asset_store():
+    """Requests see assets added by other worker processes if store is shared between them"""
+    app.bank.sync()
+
+
+@app.before_request
+async def start_request_timer():
+    if app.metrics.enabled:
+        g.request_started_at = time.perf_counter()
+
+
+@app.after_request
+async def observe_request_duration(response):
+    if app.metrics.enabled and 'request_started_at' in g:
+        route = request.url_rule.rule if request.url_rule is not None else 'not_found'
+        app.metrics.observe(REQUEST_DURATION_METRIC, route, time.perf_counter() - g.request_started_at)
+
+    return response
+
+
+@app.after_request
+async def compress_response(response):
+    """Compress large response bodies if client accepts gzip or brotli (runs before request duration is observed)"""
+    if not is_compressible(response, not isinstance(response.response, DataBody)):
+        return response
+
+    # body is read only if it is going to be compressed
+    encoding = choose_encoding(request.accept_encodings, response.content_length, app.response_compression_min_size)
+    if encoding is not None:
+        data = await response.get_data()
+        with app.metrics.timer(STAGE_DURATION_METRIC, 'compression'):
+            set_compressed_body(response, compress(data, encoding), encoding)
+
+    return response
+
+
+@app.route(f'{API_ROUTE}/calculate_revenue')
+async def calc_assets_revenue():
+    """
+    Provides path to calculate total revenue for web_service, periods are listed or given as range,
+    see calculate_revenue route of asset_web_service
+    :return: total revenue for all assets behind all periods provided (in json)
+    """
+    app.logger.info('called "%s/calculate_revenue" route', API_ROUTE)
+
+    period_range = parse_revenue_period_range(request.args)
+    key_indicators_col, currency_rate_col = await get_cbr_collections(CBR_KEY_INDICATORS_URL, CBR_CURRENCY_RATE_URL)
+    if period_range is not None:
+        try:
+            curve = app.bank.iter_revenue_curve(period_range, key_indicators_col, currency_rate_col)
+        except OverflowError as error:
+            app.logger.warning('revenue curve is rejected, %s', error)
+            abort(400)
+
+        if len(period_range) >= REVENUE_CURVE_STREAM_MIN_PERIODS:
+            return Response(iterate_chunks(generate_revenue_curve_chunks(curve)), mimetype='application/json')
+
+        with app.metrics.timer(STAGE_DURATION_METRIC, 'revenue_calculation'):
+            result = {str(period): revenue for chunk in curve for period, revenue in chunk}
+        with app.metrics.timer(STAGE_DURATION_METRIC, 'json_serialization'):
+            return jsonify(result)
+
+    period_list = list(map(lambda x: abs(int(x)), request.args.getlist('period')))
+    with app.metrics.timer(STAGE_DURATION_METRIC, 'revenue_calculation'):
+        result = app.revenue_cache.calculate_revenue(app.bank, period_list, key_indicators_col, currency_rate_col)
+
+    with app.metrics.timer(STAGE_DURATION_METRIC, 'json_serialization'):
+        return jsonify(result)
+
+
+@app.route(f'{API_ROUTE}/get')
+async def get_asset_list_with_provided_names():
+    """
+    Provides path to query web service to get assets with names provided
+    :return: list of assets according to the provided names (in json)
+    """
+    app.logger.info('called "%s/get" route', API_ROUTE)
+    name_list = request.args.getlist('name')
+    paged_response = make_paged_asset_list_response(name_list)
+    if paged_response is not None:
+        return paged_response
+
+    result = app.bank.get_asset_list(name_list)
+
+    with app.metrics.timer(STAGE_DURATION_METRIC, 'json_serialization'):
+        return jsonify(result)
+
+
+@app.route(f'{API_ROUTE}/cleanup')
+async def clean_asset_list():
+    """Provides path to clean all assets stored"""
+    app.logger.info('called "%s/cleanup" route', API_ROUTE)
+    app.bank.clear()
+
+    return 'assets list has been cleaned', 200
+
+
+@app.route(f'{API_ROUTE}/list')
+async def get_asset_list():
+    """
+    Provides path to get list of all assets
+    :return: list of all assets stored (in json)
+    """
+    app.logger.info('called "%s/list" route, run get_asset_list function', API_ROUTE)
+    paged_response = make_paged_asset_list_response()
+    if paged_response is not None:
+        return paged_response
+
+    version = app.bank.version
+    cache = app.asset_list_cache
+    if cache is None or cache[0] != version:
+        asset_list = app.bank.get_asset_list()
+        with app.metrics.timer(STAGE_DURATION_METRIC, 'json_serialization'):
+            cache = app.asset_list_cache = (version, app.json.dumps(asset_list).encode(), {})
+
+    response = Response(cache[1], mimetype='application/json')
+    encoding = choose_encoding(request.accept_encodings, len(cache[1]), app.response_compression_min_size)
+    if encoding is not None:
+        compressed_body = cache[2].get(encoding)
+        if compressed_body is None:
+            with app.metrics.timer(STAGE_DURATION_METRIC, 'compression'):
+                compressed_body = cache[2][encoding] = compress(cache[1], encoding)
+        set_compressed_body(response, compressed_body, encoding)
+
+    return response
+
+
+@app.route(f'{API_ROUTE}/add/<char_code>/<name>/<capital>/<interest>')
+async def add_asset_item(char_code, name, capital, interest):
+    """Provides path to add new assets for web service"""
+    app.logger.info(
+        'called "%s/add/%s/%s/%s/%s" route',
+        API_ROUTE,
+        char_code,
+        name,
+        capital,
+        interest
+    )
+
+    try:
+        add_new_asset_item(app.bank, char_code, name, capital, interest)
+    except AssetValidationError as error:
+        app.logger.warning('asset %s was not added: %s', name, error)
+        abort(error.status_code)
+
+    app.logger.info('asset %s was successfully added', name)
+
+    return f'Asset {name} was successfully added.', 200
+
+
+@app.route(f'{API_ROUTE}/bulk_add', methods=['POST'])
+async def bulk_add_asset_items():
+    """
+    Provides path to add many assets at once, see bulk_add route of asset_web_service
+    :return: number of added assets and list of errors per row (in json)
+    """
+    app.logger.info('called "%s/bulk_add" route', API_ROUTE)
+    numbered_row_list = parse_bulk_asset_rows(request.mimetype, await request.get_data(as_text=True))
+    result = bulk_add_asset_rows(app.bank, numbered_row_list)
+    app.logger.info('%s assets were added, %s rows were rejected', result['added'], len(result['errors']))
+
+    return jsonify(result)
+
+
+@app.route(JSON_DAILY_ROUTE)
+async def get_currency_rate_collection():
+    """
+    Provides path to get actual daily currency rate from cbr.ru
+    :return: currency index (in json)
+    """
+    app.logger.info('called "%s" route', JSON_DAILY_ROUTE)
+    currency_index, = await get_cbr_collections(CBR_CURRENCY_RATE_URL)
+
+    return await make_conditional_json_response(currency_index)
+
+
+@app.route(JSON_KEY_INDICATORS_ROUTE)
+async def get_key_indicator_collection():
+    """
+    Provides path to get actual key indicator values from cbr.ru
+    :return: currency index (in json)
+    """
+    app.logger.info('called "%s" route', JSON_KEY_INDICATORS_ROUTE)
+    key_indicator_collection, = await get_cbr_collections(CBR_KEY_INDICATORS_URL)
+
+    return await make_conditional_json_response(key_indicator_collection)
+
+
+@app.route(RATE_CACHE_STATS_ROUTE)
+async def get_rate_cache_stats():
+    """
+    Provides path to get cbr.ru pages cache counters
+    :return: hits, misses and age of cached pages, number of coalesced cbr.ru requests
+        and revenue cache counters (in json)
+    """
+    app.logger.info('called "%s" route', RATE_CACHE_STATS_ROUTE)
+    stats = app.rate_cache.stats()
+    stats['single_flight'] = app.cbr_single_flight.stats()
+    stats['revenue_cache'] = app.revenue_cache.stats()
+
+    return jsonify(stats)
+
+
+@app.route(METRICS_ROUTE)
+async def get_metrics():
+    """
+    Provides path to get request and stage duration histograms (if METRICS_ENABLED is set)
+    :return: metrics in Prometheus text format
+    """
+    return Response(app.metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.errorhandler(404)
+async def page_not_found(error):
+    return await render_template('page_not_found.html'), 404
+
+
+@app.errorhandler(503)
+async def cbr_service_unavailable(error):
+    return 'CBR service is unavailable', 503
+
+
+def make_paged_asset_list_response(name_list=None):
+    """
+    Build response for asset list requested with limit, cursor or stream query arguments
+    :return: response or None if list is requested as a whole
+    """
+    page_args = parse_asset_page_args(request.args)
+    if page_args is None:
+        return None
+
+    limit, after, stream_format = page_args
+    if stream_format is not None:
+        return Response(
+            iterate_chunks(
+                generate_asset_list_chunks(app.bank, name_list, after, stream_format, ASSET_STREAM_CHUNK_SIZE)
+            ),
+            mimetype=ASSET_STREAM_MIMETYPES[stream_format]
+        )
+
+    asset_page = get_asset_page(app.bank, name_list, after, limit)
+    with app.metrics.timer(STAGE_DURATION_METRIC, 'json_serialization'):
+        return jsonify(asset_page)
+
+
+async def iterate_chunks(chunk_iterator):
+    """Yield encoded chunks of asset list or revenue curve on event loop, store is never touched from other threads"""
+    for chunk in chunk_iterator:
+        yield chunk.encode()
+
+
+async def make_conditional_json_response(collection: dict) -> Response:
+    """Json response with ETag derived from its content, replies 304 if client already has it"""
+    response = jsonify(collection)
+    await response.add_etag()
+
+    return await response.make_conditional(request)
+
+
+async def get_cbr_collections(*url_list) -> list:
+    """
+    Get parsed cbr.ru pages from rate cache, pages missed in cache are fetched concurrently.
+    Abort with 503 if cbr.ru is unavailable
+    :return: list of parsed pages as dicts in the order of urls provided
+    """
+    try:
+        return await asyncio.gather(*map(get_cbr_collection, url_list))
+    except CBRServiceUnavailableError as error:
+        app.logger.error('%s service is unavailable now, %s', CBR_BASE_URL, error)
+        abort(503)
+
+
+async def get_cbr_collection(url: str) -> dict:
+    """
+    Get parsed cbr.ru page from rate cache, stale page is reloaded in background task
+    :raise CBRServiceUnavailableError: if there is no usable page in cache and cbr.ru is unavailable
+    """
+    collection, revalidate = app.rate_cache.lookup(url)
+    if collection is None:
+        collection = await app.cbr_single_flight.do(url, load_cbr_collection, url)
+        app.rate_cache.put(url, collection)
+    elif revalidate:
+        task = asyncio.create_task(revalidate_cbr_collection(url))
+        app.revalidation_task_set.add(task)
+        task.add_done_callback(app.revalidation_task_set.discard)
+
+    return collection
+
+
+async def revalidate_cbr_collection(url: str) -> None:
+    try:
+        app.rate_cache.put(url, await app.cbr_single_flight.do(url, load_cbr_collection, url))
+    except CBRServiceUnavailableError as error:
+        app.logger.warning('failed to revalidate cached page %s: %s', url, error)
+    except Exception:
+        app.logger.exception('failed to parse revalidated page %s', url)
+    finally:
+        # put has not run if load failed, so the next stale hit reloads page again
+        app.rate_cache.cancel_revalidation(url)
+
+
+async def load_cbr_collection(url: str) -> dict:
+    """
+    Fetch cbr.ru page without blocking event loop and parse it in worker thread
+    :raise CBRServiceUnavailableError: if cbr.ru is unreachable or replies with error status code
+    :return: parsed page as dict
+    """
+    try:
+        with app.metrics.timer(STAGE_DURATION_METRIC, 'cbr_fetch'):
+            response = await app.cbr_client.get(url, headers=make_conditional_cbr_headers(url))
+    except httpx.HTTPError as error:
+        raise CBRServiceUnavailableError(str(error)) from error
+
+    return await asyncio.to_thread(process_cbr_response, url, response)
@@ -0,0 +1 @@
+"""Benchmarks of asset web service, run them from repository root: python -m benchmarks.<module>"""
@@ -0,0 +1,8 @@
+"""Asset rows shared by benchmarks, it does not import web service, so load test client does not load it"""
+CHAR_CODE_LIST = ['RUB', 'USD', 'EUR', 'Au', 'Ag', 'XDR', 'AUD', 'AMD']
+
+
+def generate_asset_rows(asset_cnt: int, prefix: str = 'asset'):
+    """Yield (char_code, name, capital, interest) rows of asset_cnt assets named {prefix}_{i}"""
+    for i in range(asset_cnt):
+        yield CHAR_CODE_LIST[i % len(CHAR_CODE_LIST)], f'{prefix}_{i}', 1_000.0 + i, 0.01 + (i % 97) / 100
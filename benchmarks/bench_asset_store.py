@@ -0,0 +1,65 @@
+"""
+Benchmark of memory used by asset store: bytes per asset kept as list of AssetItem objects
+vs column-oriented CompositeAssetItem storage (with its name index and row order)
+"""
+import argparse
+import gc
+import tracemalloc
+
+from composite_store import AssetItem, CompositeAssetItem
+
+from benchmarks.asset_rows import generate_asset_rows
+
+
+def measure_allocated_bytes(build_function, asset_cnt: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    store = build_function(asset_cnt)
+    allocated_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+
+    return allocated_bytes
+
+
+def build_asset_item_list(asset_cnt: int) -> list:
+    return [
+        AssetItem(name, char_code, capital, interest)
+        for char_code, name, capital, interest in generate_asset_rows(asset_cnt)
+    ]
+
+
+def build_composite_store(asset_cnt: int) -> CompositeAssetItem:
+    store = CompositeAssetItem(name='bench')
+    # asset items are temporary, only memory kept by store is measured after they are freed
+    store.add_many_if_absent([
+        AssetItem(name, char_code, capital, interest)
+        for char_code, name, capital, interest in generate_asset_rows(asset_cnt)
+    ])
+
+    return store
+
+
+def build_name_list(asset_cnt: int) -> list:
+    return [name for _, name, _, _ in generate_asset_rows(asset_cnt)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--assets', type=int, default=1_000_000, help='number of assets to store')
+    args = parser.parse_args()
+
+    name_bytes = measure_allocated_bytes(build_name_list, args.assets)
+    for title, build_function in [
+        ('list of AssetItem', build_asset_item_list),
+        ('CompositeAssetItem', build_composite_store),
+    ]:
+        allocated_bytes = measure_allocated_bytes(build_function, args.assets)
+        print(
+            f'{title:<30}{allocated_bytes / args.assets:>10.1f} bytes per asset'
+            f'{(allocated_bytes - name_bytes) / args.assets:>10.1f} bytes per asset without names'
+        )
+
+
+if __name__ == '__main__':
+    main()
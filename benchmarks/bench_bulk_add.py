@@ -0,0 +1,59 @@
+"""Benchmark of asset insert throughput: single add route per asset vs bulk_add route"""
+import argparse
+import json
+import logging
+import time
+
+from asset_web_service import API_ROUTE, app
+
+from benchmarks.asset_rows import generate_asset_rows
+
+
+def bench_single_add(client, asset_cnt: int) -> float:
+    start = time.perf_counter()
+    for char_code, name, capital, interest in generate_asset_rows(asset_cnt, 'single'):
+        response = client.get(f'{API_ROUTE}/add/{char_code}/{name}/{capital}/{interest}')
+        assert 200 == response.status_code
+
+    return time.perf_counter() - start
+
+
+def bench_bulk_add(client, asset_cnt: int, content_type: str) -> float:
+    row_list = list(generate_asset_rows(asset_cnt, f'bulk_{content_type}'))
+    if content_type == 'application/json':
+        body = json.dumps(row_list)
+    elif content_type == 'application/x-ndjson':
+        body = '\n'.join(map(json.dumps, row_list))
+    else:
+        body = '\n'.join(','.join(map(str, row)) for row in row_list)
+
+    start = time.perf_counter()
+    response = client.post(f'{API_ROUTE}/bulk_add', data=body, content_type=content_type)
+    elapsed = time.perf_counter() - start
+    assert asset_cnt == response.json['added']
+
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--assets', type=int, default=100_000, help='number of assets added by bulk request')
+    parser.add_argument('--single-assets', type=int, default=2_000, help='number of assets added one by one')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    with app.test_client() as client:
+        client.get(f'{API_ROUTE}/cleanup')
+        elapsed = bench_single_add(client, args.single_assets)
+        print(f'{"single add route":<30}{args.single_assets / elapsed:>12.0f} assets/s')
+
+        for content_type in ['application/json', 'application/x-ndjson', 'text/csv']:
+            client.get(f'{API_ROUTE}/cleanup')
+            elapsed = bench_bulk_add(client, args.assets, content_type)
+            print(f'{"bulk add " + content_type:<30}{args.assets / elapsed:>12.0f} assets/s')
+
+        client.get(f'{API_ROUTE}/cleanup')
+
+
+if __name__ == '__main__':
+    main()
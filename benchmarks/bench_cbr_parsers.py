@@ -0,0 +1,69 @@
+"""
+Micro-benchmark of cbr.ru page parsers on html snapshots:
+per-column xpath queries compiled on every call vs precompiled single pass over table rows
+"""
+import argparse
+import logging
+import timeit
+
+from lxml import etree
+
+from asset_web_service import parse_cbr_currency_daily_html, parse_cbr_key_indicators_html
+
+SNAPSHOT_ENCODING_COLLECTION = {
+    'cbr_currency_base_daily.html': 'utf-8',
+    'cbr_key_indicators.html': 'cp1251',
+}
+
+
+def parse_cbr_currency_daily_html_per_column(html_document: str) -> dict:
+    root = etree.fromstring(html_document, etree.HTMLParser())
+    char_code_collection = root.xpath("//table[@class='data']//tr/td[2]/text()")
+    unit_cnt = root.xpath("//table[@class='data']//tr/td[3]/text()")
+    rate_collection = root.xpath("//table[@class='data']//tr/td[5]/text()")
+
+    return {
+        code: round(float(rate) / float(cnt), 8)
+        for code, rate, cnt in zip(char_code_collection, rate_collection, unit_cnt)
+    }
+
+
+def parse_cbr_key_indicators_html_per_column(html_document: str) -> dict:
+    root = etree.fromstring(html_document, etree.HTMLParser())
+    char_code_collection = root.xpath(
+        '//div[@class="dropdown"][1]//div[@class="col-md-3 offset-md-1 _subinfo"]/text()'
+    )
+    rate_collection = root.xpath(
+        '//div[@class="dropdown"][1]//td[@class="value td-w-4 _bold _end mono-num"]/text()'
+    )
+
+    return {code: float(rate.replace(',', '')) for code, rate in zip(char_code_collection, rate_collection)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=200, help='number of parses per measurement')
+    args = parser.parse_args()
+
+    logging.disable(logging.DEBUG)
+    for snapshot_file_path, per_column_function, single_pass_function in [
+        ('cbr_currency_base_daily.html', parse_cbr_currency_daily_html_per_column, parse_cbr_currency_daily_html),
+        ('cbr_key_indicators.html', parse_cbr_key_indicators_html_per_column, parse_cbr_key_indicators_html),
+    ]:
+        with open(snapshot_file_path, encoding=SNAPSHOT_ENCODING_COLLECTION[snapshot_file_path]) as f_in:
+            html_document = f_in.read()
+
+        assert per_column_function(html_document) == single_pass_function(html_document)
+
+        per_column_time = min(timeit.repeat(lambda: per_column_function(html_document), number=args.number, repeat=5))
+        single_pass_time = min(timeit.repeat(lambda: single_pass_function(html_document), number=args.number, repeat=5))
+        print(
+            f'{snapshot_file_path:<32}'
+            f'per column {per_column_time / args.number * 1e3:.3f} ms, '
+            f'single pass {single_pass_time / args.number * 1e3:.3f} ms, '
+            f'speedup x{per_column_time / single_pass_time:.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
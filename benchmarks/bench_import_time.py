@@ -0,0 +1,61 @@
+"""
+Benchmark of cold start of service worker: fresh interpreter imports asset_web_service and creates app
+with `python -X importtime`. Lazy start is compared with eager one, which imports requests, lxml, yaml
+and numpy upfront and parses logging.config.yml as service did before they were loaded on first use
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+IMPORT_TIME_PREFIX = 'import time:'
+SCENARIOS = {
+    'lazy': 'import asset_web_service; asset_web_service.create_app()',
+    'eager': (
+        'import requests, lxml.etree, yaml, numpy; import asset_web_service; '
+        'yaml.safe_load(open(asset_web_service.LOGGING_CONFIG_YAML_FILE_PATH)); asset_web_service.create_app()'
+    ),
+}
+
+
+def run_scenario(code: str) -> tuple:
+    """:return: wall seconds of interpreter run and {top level module: cumulative import microseconds}"""
+    started_at = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True
+    )
+    elapsed = time.perf_counter() - started_at
+
+    module_collection = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX) or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len(IMPORT_TIME_PREFIX):].split('|')
+        # nested imports are indented, top level ones are imported by interpreter start and the command itself
+        if not module.startswith('  '):
+            module_collection[module.strip()] = int(cumulative)
+
+    return elapsed, module_collection
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10, help='number of interpreter runs per scenario')
+    parser.add_argument('--top', type=int, default=8, help='number of slowest top level imports to show')
+    args = parser.parse_args()
+
+    # the first run warms up file system cache and writes logging config cache
+    run_scenario(SCENARIOS['lazy'])
+    for title, code in SCENARIOS.items():
+        run_list = [run_scenario(code) for _ in range(args.runs)]
+        module_collection = run_list[-1][1]
+        import_ms = statistics.median(sum(modules.values()) for _, modules in run_list) / 1000
+        wall_ms = statistics.median(elapsed for elapsed, _ in run_list) * 1000
+        print(f'{title:<8}imports: {import_ms:>8.1f} ms    interpreter run: {wall_ms:>8.1f} ms')
+        for module, cumulative in sorted(module_collection.items(), key=lambda item: -item[1])[:args.top]:
+            print(f'{"":<8}{module:<32}{cumulative / 1000:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark of asset list response: CPU time and size of json made by stdlib json provider
+vs orjson provider, and of its gzip/brotli compression
+"""
+import argparse
+import time
+
+from flask.json.provider import DefaultJSONProvider
+
+import compression
+from asset_web_service import app
+from composite_store import AssetItem, CompositeAssetItem
+from json_provider import FastJSONProvider, orjson
+
+from benchmarks.asset_rows import generate_asset_rows
+
+
+def measure_cpu_seconds(function, *args, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        started_at = time.process_time()
+        result = function(*args)
+        best = min(best, time.process_time() - started_at)
+
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--assets', type=int, default=200_000, help='number of assets in listing')
+    parser.add_argument('--repeat', type=int, default=5, help='best of repeat runs is reported')
+    args = parser.parse_args()
+
+    store = CompositeAssetItem(name='bench')
+    store.add_many([
+        AssetItem(name, char_code, capital, interest)
+        for char_code, name, capital, interest in generate_asset_rows(args.assets)
+    ])
+    asset_list = store.get_asset_list()
+
+    with app.app_context():
+        provider_list = [('stdlib json provider', DefaultJSONProvider(app))]
+        if orjson is not None:
+            provider_list.append(('orjson provider', FastJSONProvider(app)))
+        for title, provider in provider_list:
+            seconds, response = measure_cpu_seconds(provider.response, asset_list, repeat=args.repeat)
+            body = response.get_data()
+            print(f'{title:<30}{seconds * 1000:>10.1f} ms cpu{len(body) / 2 ** 20:>10.2f} MiB')
+
+    for encoding in compression.AVAILABLE_ENCODINGS:
+        seconds, compressed_body = measure_cpu_seconds(compression.compress, body, encoding, repeat=args.repeat)
+        print(
+            f'{encoding + " compression":<30}{seconds * 1000:>10.1f} ms cpu{len(compressed_body) / 2 ** 20:>10.2f} MiB'
+            f'{len(body) / len(compressed_body):>10.1f}x smaller'
+        )
+
+
+if __name__ == '__main__':
+    main()
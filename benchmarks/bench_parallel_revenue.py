@@ -0,0 +1,63 @@
+"""
+Benchmark of revenue calculation sharded across process pool: time and speedup
+of CompositeAssetItem.calculate_revenue from 1 to N worker processes
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import composite_store
+from composite_store import AssetItem, CompositeAssetItem
+
+from benchmarks.asset_rows import CHAR_CODE_LIST
+
+KEY_INDICATOR_COLLECTION = {'USD': 73.9735, 'EUR': 89.3304, 'Au': 4361.69, 'Ag': 56.1}
+CURRENCY_RATE_COLLECTION = {'XDR': 56.7525, 'AUD': 57.0229, 'AMD': 0.1911}
+
+
+def build_store(group_cnt: int) -> CompositeAssetItem:
+    """Store where every asset is a group of its own, so nothing is folded by aggregation"""
+    store = CompositeAssetItem(name='bench')
+    store.add_many([
+        AssetItem(f'asset_{i}', CHAR_CODE_LIST[i % len(CHAR_CODE_LIST)], 1_000.0 + i, 0.01 + i / group_cnt)
+        for i in range(group_cnt)
+    ])
+
+    return store
+
+
+def measure_seconds(store: CompositeAssetItem, period_list: list, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        store.calculate_revenue(period_list, KEY_INDICATOR_COLLECTION, CURRENCY_RATE_COLLECTION)
+        best = min(best, time.perf_counter() - started_at)
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--groups', type=int, default=2_000_000, help='number of (char_code, interest) groups')
+    parser.add_argument('--periods', type=int, default=30, help='number of periods, 1..periods')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count(), help='max number of worker processes')
+    parser.add_argument('--repeat', type=int, default=3, help='best of repeat runs is reported')
+    args = parser.parse_args()
+
+    store = build_store(args.groups)
+    period_list = list(range(1, args.periods + 1))
+    composite_store.PARALLEL_REVENUE_MIN_GROUPS = 0
+
+    single_process_seconds = measure_seconds(store, period_list, args.repeat)
+    print(f'{"single process":<20}{single_process_seconds:>10.3f} s')
+    for worker_cnt in range(1, args.max_workers + 1):
+        with ProcessPoolExecutor(worker_cnt) as process_pool:
+            store.process_pool, store.shard_cnt = process_pool, worker_cnt
+            store.calculate_revenue(period_list[:1], KEY_INDICATOR_COLLECTION, CURRENCY_RATE_COLLECTION)
+            seconds = measure_seconds(store, period_list, args.repeat)
+        print(f'{f"{worker_cnt} workers":<20}{seconds:>10.3f} s{single_process_seconds / seconds:>10.2f}x')
+
+
+if __name__ == '__main__':
+    main()
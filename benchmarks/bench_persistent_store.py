@@ -0,0 +1,61 @@
+"""
+Benchmark of warm start of persistent asset store: time to open store of N assets
+from memory-mapped snapshot vs replay of its log
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from composite_store import AssetItem
+from persistent_store import PersistentAssetStore
+
+from benchmarks.asset_rows import generate_asset_rows
+
+
+def measure_seconds(function, *args):
+    started_at = time.perf_counter()
+    result = function(*args)
+
+    return time.perf_counter() - started_at, result
+
+
+def open_store(path: str) -> PersistentAssetStore:
+    return PersistentAssetStore(name='bench', path=path, snapshot_log_size=float('inf'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--assets', type=int, default=1_000_000, help='number of assets to store')
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix='bench_persistent_store_')
+    try:
+        store = open_store(path)
+        asset_item_list = [
+            AssetItem(name, char_code, capital, interest)
+            for char_code, name, capital, interest in generate_asset_rows(args.assets)
+        ]
+        seconds, _ = measure_seconds(store.add_many, asset_item_list)
+        print(f'{"add_many with log":<30}{seconds:>10.3f} s')
+        store._log.close()
+        del asset_item_list, store
+
+        seconds, store = measure_seconds(open_store, path)
+        print(f'{"open replaying log":<30}{seconds:>10.3f} s')
+        seconds, _ = measure_seconds(store.snapshot)
+        print(f'{"write snapshot":<30}{seconds:>10.3f} s')
+        store._log.close()
+        snapshot_size = os.path.getsize(store._get_file_path('snapshot'))
+        del store
+
+        seconds, store = measure_seconds(open_store, path)
+        assert args.assets == len(store)
+        print(f'{"open mapping snapshot":<30}{seconds:>10.3f} s{snapshot_size / args.assets:>10.1f} bytes per asset')
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+Load test of asset web service over http: cbr.ru pages are served from snapshots by local stub server,
+service is started in subprocess with CBR_BASE_URL pointing to the stub, every route is requested
+by pool of concurrent clients. Reports req/s, p50/p99 latency per route and RSS of service processes
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+
+import requests
+
+from benchmarks.asset_rows import generate_asset_rows
+
+STUB_HOST = '127.0.0.1'
+SERVICE_START_TIMEOUT = 30
+DEFAULT_SERVER_COMMAND = (
+    f'{shlex.quote(sys.executable)} -c '
+    '"from asset_web_service import create_app; create_app().run(host=\'{host}\', port={port}, threaded=True)"'
+)
+# path of cbr.ru page relative to CBR_BASE_URL: (snapshot file, charset of snapshot)
+CBR_STUB_PAGES = {
+    '/currency_base/daily/': ('cbr_currency_base_daily.html', 'utf-8'),
+    '/key-indicators/': ('cbr_key_indicators.html', 'windows-1251'),
+}
+
+
+class CBRStubHandler(BaseHTTPRequestHandler):
+    """Serves snapshots of cbr.ru pages with ETag and replies 304 to matching If-None-Match"""
+    page_collection = {}
+
+    def do_GET(self):
+        page = self.page_collection.get(self.path)
+        if page is None:
+            self.send_error(404)
+            return
+
+        body, charset, etag = page
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', f'text/html; charset={charset}')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_cbr_stub_server() -> ThreadingHTTPServer:
+    for path, (file_path, charset) in CBR_STUB_PAGES.items():
+        with open(file_path, 'rb') as f_in:
+            body = f_in.read()
+        CBRStubHandler.page_collection[path] = (body, charset, f'"{hashlib.sha1(body).hexdigest()}"')
+
+    server = ThreadingHTTPServer((STUB_HOST, 0), CBRStubHandler)
+    threading.Thread(target=server.serve_forever, name='cbr-stub', daemon=True).start()
+
+    return server
+
+
+def start_service(server_command: str, cbr_base_url: str, host: str, port: int) -> subprocess.Popen:
+    """Start service and wait until it replies"""
+    env = dict(os.environ, CBR_BASE_URL=cbr_base_url)
+    process = subprocess.Popen(
+        shlex.split(server_command.format(host=host, port=port)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + SERVICE_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://{host}:{port}/cbr/cache_stats', timeout=1)
+            return process
+        except requests.ConnectionError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError(f'service has not started: {server_command}')
+
+
+def get_rss_bytes(pid: int):
+    """:return: RSS of process and its children (Linux only, None on other platforms)"""
+    try:
+        with open(f'/proc/{pid}/status') as status_file:
+            rss_kb = next(int(line.split()[1]) for line in status_file if line.startswith('VmRSS:'))
+        with open(f'/proc/{pid}/task/{pid}/children') as children_file:
+            child_pid_list = [int(child_pid) for child_pid in children_file.read().split()]
+    except (OSError, StopIteration):
+        return None
+
+    return rss_kb * 1024 + sum(get_rss_bytes(child_pid) or 0 for child_pid in child_pid_list)
+
+
+def percentile(sorted_value_list: list, share: float) -> float:
+    return sorted_value_list[min(len(sorted_value_list) - 1, int(share * len(sorted_value_list)))]
+
+
+def run_scenario(base_url: str, request_factory, request_cnt: int, concurrency: int) -> tuple:
+    """
+    Send request_cnt requests made by request_factory(i) -> (method, path, kwargs) from concurrency threads
+    :return: elapsed seconds, sorted latencies in seconds and number of failed requests
+    """
+    session_storage = threading.local()
+
+    def send(i):
+        session = getattr(session_storage, 'session', None)
+        if session is None:
+            session = session_storage.session = requests.Session()
+        method, path, kwargs = request_factory(i)
+        started_at = time.perf_counter()
+        response = session.request(method, f'{base_url}{path}', **kwargs)
+        response.content
+        return time.perf_counter() - started_at, response.status_code >= 400
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        result_list = list(executor.map(send, range(request_cnt)))
+    elapsed = time.perf_counter() - started_at
+
+    return elapsed, sorted(latency for latency, _ in result_list), sum(failed for _, failed in result_list)
+
+
+def make_scenarios(args) -> list:
+    """:return: list of (title, request count, request factory)"""
+    bulk_request_cnt = -(-args.assets // args.bulk_rows)
+    asset_row_list = list(generate_asset_rows(args.assets, 'load'))
+    name_list = [row[1] for row in asset_row_list]
+    period_query = '&'.join(f'period={period}' for period in range(1, args.periods + 1))
+    add_counter = count()
+    rnd = random.Random(0)
+
+    def bulk_add(i):
+        row_list = asset_row_list[i * args.bulk_rows:(i + 1) * args.bulk_rows]
+        return 'POST', '/api/asset/bulk_add', {
+            'data': json.dumps(row_list), 'headers': {'Content-Type': 'application/json'}
+        }
+
+    def add(i):
+        return 'GET', f'/api/asset/add/USD/load_single_{next(add_counter)}/1000/0.1', {}
+
+    def get(i):
+        return 'GET', '/api/asset/get?' + '&'.join(f'name={name}' for name in rnd.sample(name_list, 10)), {}
+
+    return [
+        ('bulk_add', bulk_request_cnt, bulk_add),
+        ('add', args.requests, add),
+        ('list', args.requests, lambda i: ('GET', '/api/asset/list', {})),
+        ('list?limit=100', args.requests, lambda i: ('GET', '/api/asset/list?limit=100', {})),
+        ('get 10 names', args.requests, get),
+        (f'calculate_revenue {args.periods} periods', args.requests, lambda i: (
+            'GET', f'/api/asset/calculate_revenue?{period_query}', {}
+        )),
+        ('cbr/daily', args.requests, lambda i: ('GET', '/cbr/daily', {})),
+        ('cbr/key_indicators', args.requests, lambda i: ('GET', '/cbr/key_indicators', {})),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency', type=int, default=8, help='number of concurrent clients')
+    parser.add_argument('--assets', type=int, default=10_000, help='portfolio size added by bulk_add requests')
+    parser.add_argument('--bulk-rows', type=int, default=1_000, help='rows per bulk_add request')
+    parser.add_argument('--requests', type=int, default=1_000, help='number of requests per route')
+    parser.add_argument('--periods', type=int, default=100, help='number of periods of calculate_revenue request')
+    parser.add_argument('--port', type=int, default=5055, help='port of service')
+    parser.add_argument(
+        '--server-command',
+        default=DEFAULT_SERVER_COMMAND,
+        help='command to start service with {host} and {port} placeholders, '
+             'e.g. "gunicorn -w 4 -b {host}:{port} asset_web_service:create_app()"'
+    )
+    args = parser.parse_args()
+
+    stub_server = start_cbr_stub_server()
+    cbr_base_url = f'http://{STUB_HOST}:{stub_server.server_port}/'
+    process = start_service(args.server_command, cbr_base_url, STUB_HOST, args.port)
+    base_url = f'http://{STUB_HOST}:{args.port}'
+    try:
+        requests.get(f'{base_url}/api/asset/cleanup')
+        _, latency_list, failed_cnt = run_scenario(
+            base_url, lambda i: ('GET', '/api/asset/calculate_revenue?period=1', {}), 1, 1
+        )
+        print(f'cold calculate_revenue (cbr.ru fetch and parse): {latency_list[0] * 1000:.1f} ms, failed: {failed_cnt}')
+
+        print(f'{"route":<32}{"requests":>10}{"failed":>8}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}')
+        for title, request_cnt, request_factory in make_scenarios(args):
+            elapsed, latency_list, failed_cnt = run_scenario(base_url, request_factory, request_cnt, args.concurrency)
+            print(
+                f'{title:<32}{request_cnt:>10}{failed_cnt:>8}{request_cnt / elapsed:>10.0f}'
+                f'{percentile(latency_list, 0.5) * 1000:>10.2f}{percentile(latency_list, 0.99) * 1000:>10.2f}'
+            )
+
+        rss_bytes = get_rss_bytes(process.pid)
+        print(f'service RSS: {"n/a" if rss_bytes is None else f"{rss_bytes / 2 ** 20:.1f} MiB"}')
+        requests.get(f'{base_url}/api/asset/cleanup')
+    finally:
+        process.terminate()
+        process.wait()
+        stub_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,101 @@
 """Module to efficient store assets using composite design pattern"""
 from abc import ABC, abstractmethod
-from collections import defaultdict
-from typing import Optional
+from array import array
+from bisect import bisect_right, insort
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from itertools import chain, count
+import math
+from multiprocessing import shared_memory
+from threading import Lock, RLock
+from typing import Iterator, Optional
+
+VECTORIZED_REVENUE_MIN_GROUPS = 64
+REVENUE_CACHE_SIZE = 256
+PARALLEL_REVENUE_MIN_GROUPS = 200_000
+REVENUE_POWER_TABLE_SIZE = 64
+ORDER_CHUNK_SIZE = 1024
+
+
+@lru_cache(maxsize=None)
+def import_numpy():
+    """
+    numpy is imported on the first vectorized calculation and not on import of store,
+    as it takes longer to import than the rest of service
+    :return: numpy module or None if it is not installed
+    """
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover
+        return None
+
+    return numpy
+
+
+_store_version_counter = count(1)
+
+
+def resolve_rate(char_code: str, key_indicator_col: dict, currency_rate_col: dict) -> float:
+    """Rate of char_code in RUB, key indicators take precedence over daily currency rate"""
+    if char_code == 'RUB':
+        return 1
+    if char_code in key_indicator_col:
+        return key_indicator_col[char_code]
+    return currency_rate_col[char_code]
+
+
+def get_shared_group_columns(buffer, group_cnt: int) -> tuple:
+    """
+    Views of group columns packed into one shared memory buffer:
+    capital and interest as float64, code_id as uint32
+    """
+    float_view = buffer.cast('B')[:16 * group_cnt].cast('d')
+    code_id_view = buffer.cast('B')[16 * group_cnt:20 * group_cnt].cast('I')
+
+    return float_view[:group_cnt], float_view[group_cnt:], code_id_view
+
+
+def calculate_shared_groups_revenue(
+        shm_name: str,
+        group_cnt: int,
+        start: int,
+        stop: int,
+        period_li: list,
+        code_rate_li: list
+) -> list:
+    """
+    Partial revenue per period of groups [start, stop) stored in shared memory block,
+    runs in worker process of pool so block is attached by name instead of pickling columns
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        capital, interest, code_id = get_shared_group_columns(shm.buf, group_cnt)
+        np = import_numpy()
+        if np is not None:
+            capital = np.frombuffer(capital, dtype=np.float64)[start:stop]
+            interest = np.frombuffer(interest, dtype=np.float64)[start:stop]
+            rate = np.array(code_rate_li, dtype=np.float64)[np.frombuffer(code_id, dtype=np.uint32)[start:stop]]
+            period_arr = np.asarray(period_li, dtype=np.float64)
+            revenue = (capital * rate)[:, None] * ((1.0 + interest)[:, None] ** period_arr - 1.0)
+            result = np.round(revenue, 8).sum(axis=0).tolist()
+        else:
+            result = [
+                sum(
+                    round(capital[i] * code_rate_li[code_id[i]] * ((1.0 + interest[i]) ** period - 1.0), 8)
+                    for i in range(start, stop)
+                )
+                for period in period_li
+            ]
+        del capital, interest, code_id
+    finally:
+        shm.close()
+
+    return result
 
 
 class Component(ABC):
+    __slots__ = ('name',)
+
     def __init__(self, name: str):
         self.name = name
 
@@ -18,6 +109,8 @@ class Component(ABC):
 
 
 class AssetItem(Component):
+    __slots__ = ('char_code', 'capital', 'interest')
+
     def __init__(self, name: str, char_code: str, capital: float, interest: float):
         super().__init__(name)
         self.char_code = char_code
@@ -30,12 +123,7 @@ class AssetItem(Component):
 
     def calculate_revenue(self, period_li: list, key_indicator_col: dict, currency_rate_col: dict) -> dict:
         res = {}
-        if self.char_code == 'RUB':
-            rate = 1
-        elif self.char_code in key_indicator_col.keys():
-            rate = key_indicator_col[self.char_code]
-        else:
-            rate = currency_rate_col[self.char_code]
+        rate = resolve_rate(self.char_code, key_indicator_col, currency_rate_col)
 
         for period in period_li:
             revenue = round(self.capital * rate * ((1.0 + self.interest) ** period - 1.0), 8)
@@ -43,30 +131,556 @@ class AssetItem(Component):
         return res
 
 
+class AssetColumnStore:
+    """
+    Column-oriented storage of assets: char codes are interned into code list
+    and referenced by index, capital and interest are kept in float64 arrays.
+    Revenue is linear in capital for the same char code and interest, so capital
+    is also summed up per (code_id, interest) group as assets are appended.
+    Columns are only appended to, except group capital which is changed in place,
+    its version is bumped before every such change
+    """
+    __slots__ = (
+        'name_li', 'char_code_li', 'code_id', 'capital', 'interest', '_code_index',
+        'group_code_id', 'group_interest', 'group_capital', '_group_index', 'group_capital_version',
+    )
+
+    def __init__(self):
+        self.name_li = []
+        self.char_code_li = []
+        self.code_id = array('I')
+        self.capital = array('d')
+        self.interest = array('d')
+        self._code_index = {}
+        self.group_code_id = array('I')
+        self.group_interest = array('d')
+        self.group_capital = array('d')
+        self._group_index = {}
+        self.group_capital_version = 0
+
+    def __len__(self) -> int:
+        return len(self.name_li)
+
+    @classmethod
+    def from_columns(
+            cls,
+            name_li: list,
+            char_code_li: list,
+            code_id: array,
+            capital: array,
+            interest: array,
+            group_code_id: array,
+            group_interest: array,
+            group_capital: array
+    ) -> 'AssetColumnStore':
+        """Build store from ready columns (e.g. loaded from snapshot), only lookup indexes are rebuilt"""
+        columns = cls()
+        columns.name_li = name_li
+        columns.char_code_li = char_code_li
+        columns.code_id = code_id
+        columns.capital = capital
+        columns.interest = interest
+        columns.group_code_id = group_code_id
+        columns.group_interest = group_interest
+        columns.group_capital = group_capital
+        columns._code_index = {char_code: code_id for code_id, char_code in enumerate(char_code_li)}
+        columns._group_index = dict(zip(zip(group_code_id, group_interest), range(len(group_capital))))
+
+        return columns
+
+    def append(self, name: str, char_code: str, capital: float, interest: float) -> int:
+        """Append asset and return its row index"""
+        code_id = self._code_index.get(char_code)
+        if code_id is None:
+            code_id = self._code_index[char_code] = len(self.char_code_li)
+            self.char_code_li.append(char_code)
+
+        self.code_id.append(code_id)
+        self.capital.append(capital)
+        self.interest.append(interest)
+        self.name_li.append(name)
+
+        group_id = self._group_index.get((code_id, interest))
+        if group_id is None:
+            self._group_index[code_id, interest] = len(self.group_capital)
+            self.group_code_id.append(code_id)
+            self.group_interest.append(interest)
+            self.group_capital.append(capital)
+        else:
+            # readers compare version after they have copied group capital, so it is bumped before the change
+            self.group_capital_version += 1
+            self.group_capital[group_id] += capital
+
+        return len(self.name_li) - 1
+
+    def get_sort_key(self, row: int) -> tuple:
+        return self.char_code_li[self.code_id[row]], self.name_li[row]
+
+    def get_row(self, row: int) -> list:
+        return [self.char_code_li[self.code_id[row]], self.name_li[row], self.capital[row], self.interest[row]]
+
+    def get_asset_item(self, row: int) -> AssetItem:
+        char_code, name, capital, interest = self.get_row(row)
+        return AssetItem(name, char_code, capital, interest)
+
+
+class RowOrder:
+    """
+    Immutable order of rows by key, split into sorted chunks of up to 2 * ORDER_CHUNK_SIZE rows.
+    Insert makes new order which shares all chunks but the one row is inserted into,
+    so it copies O(ORDER_CHUNK_SIZE + chunks) and not O(rows)
+    """
+    __slots__ = ('chunk_li', 'key', '_size')
+
+    def __init__(self, chunk_li: list, key):
+        self.chunk_li = chunk_li
+        self.key = key
+        self._size = sum(map(len, chunk_li))
+
+    @classmethod
+    def from_rows(cls, row_li: list, key) -> 'RowOrder':
+        """:param row_li: rows sorted by key"""
+        return cls([row_li[i:i + ORDER_CHUNK_SIZE] for i in range(0, len(row_li), ORDER_CHUNK_SIZE)], key)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[int]:
+        return chain.from_iterable(self.chunk_li)
+
+    def insert(self, row: int) -> 'RowOrder':
+        """:return: new order with row inserted after rows of the same key"""
+        if not self.chunk_li:
+            return RowOrder([[row]], self.key)
+
+        key = self.key
+        index = min(
+            bisect_right(self.chunk_li, key(row), key=lambda chunk: key(chunk[-1])),
+            len(self.chunk_li) - 1
+        )
+        chunk = self.chunk_li[index].copy()
+        insort(chunk, row, key=key)
+        chunk_li = self.chunk_li.copy()
+        chunk_li[index:index + 1] = [chunk] if len(chunk) <= 2 * ORDER_CHUNK_SIZE else [
+            chunk[:ORDER_CHUNK_SIZE], chunk[ORDER_CHUNK_SIZE:]
+        ]
+
+        return RowOrder(chunk_li, key)
+
+    def get_rows(self, after: Optional[tuple] = None, limit: Optional[int] = None) -> list:
+        """
+        :param after: return only rows following this key
+        :param limit: max number of rows to return
+        """
+        chunk_li = self.chunk_li
+        key = self.key
+        index = start = 0
+        if after is not None:
+            index = bisect_right(chunk_li, after, key=lambda chunk: key(chunk[-1]))
+            if index < len(chunk_li):
+                start = bisect_right(chunk_li[index], after, key=key)
+
+        row_li = []
+        while index < len(chunk_li) and (limit is None or len(row_li) < limit):
+            row_li.extend(chunk_li[index][start:None if limit is None else start + limit - len(row_li)])
+            index += 1
+            start = 0
+
+        return row_li
+
+
+StoreSnapshot = namedtuple(
+    'StoreSnapshot',
+    ['version', 'columns', 'name_index', 'order', 'row_cnt', 'group_cnt', 'group_capital_version']
+)
+GroupColumns = namedtuple('GroupColumns', ['char_code_li', 'code_id', 'interest', 'capital'])
+
+
 class CompositeAssetItem(Component):
-    def __init__(self, name: str, asset_collection: Optional[list] = None):
+    """
+    Composite of assets, keeps rows ordered by (char_code, name) and version
+    which is unique across all stores and changes on every modification.
+    Readers take published StoreSnapshot without locks: columns are append-only and rows
+    past row_cnt of snapshot are not read, order (RowOrder) is copied on write, so published one
+    is never changed. Group capital is changed in place, readers copy it and check that its version
+    is still the one of snapshot (taking write lock otherwise). Writers are serialized by write lock
+    """
+    __slots__ = ('columns', 'process_pool', 'shard_cnt', '_name_index', '_snapshot', '_write_lock')
+
+    def __init__(
+            self,
+            name: str,
+            asset_collection: Optional[list] = None,
+            process_pool=None,
+            shard_cnt: int = 1
+    ):
+        """
+        :param process_pool: optional ProcessPoolExecutor, revenue of stores with at least
+            PARALLEL_REVENUE_MIN_GROUPS groups is calculated in shard_cnt shards across its workers
+        """
         super().__init__(name)
-        self.asset_collection = []
-        self.asset_collection.extend(asset_collection or [])
+        self.columns = AssetColumnStore()
+        self.process_pool = process_pool
+        self.shard_cnt = shard_cnt
+        self._name_index = {}
+        self._write_lock = RLock()
+        self._publish(RowOrder([], self.columns.get_sort_key))
+        for asset_item in asset_collection or []:
+            self.add(asset_item)
+
+    def __len__(self) -> int:
+        return self._snapshot.row_cnt
+
+    def __contains__(self, name: str) -> bool:
+        snapshot = self._snapshot
+        row = snapshot.name_index.get(name)
+        return row is not None and row < snapshot.row_cnt
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    @property
+    def asset_collection(self) -> list:
+        """Stored assets materialized as AssetItem objects"""
+        return list(self.iter_asset_items())
+
+    def iter_asset_items(self) -> Iterator[AssetItem]:
+        """Iterate assets in insertion order"""
+        snapshot = self._snapshot
+        return map(snapshot.columns.get_asset_item, range(snapshot.row_cnt))
+
+    def sync(self) -> None:
+        """Bring store up to date with changes made by other processes, store kept in process memory has none"""
 
     def add(self, asset_item: AssetItem) -> None:
-        self.asset_collection.append(asset_item)
+        """Add asset, asset names are expected to be unique (name index keeps the first one)"""
+        with self._write_lock:
+            row = self.columns.append(asset_item.name, asset_item.char_code, asset_item.capital, asset_item.interest)
+            self._name_index.setdefault(asset_item.name, row)
+            self._publish(self._snapshot.order.insert(row))
 
-    def get_asset_list(self, name_list: Optional[list] = None) -> list:
-        name_list = name_list or []
-        asset_li = [
-            asset.get_asset_list() for asset in self.asset_collection
-            if not name_list or asset.name in name_list
-        ]
-        return sorted(asset_li, key=lambda x: x[0])
+    def add_many(self, asset_item_list: list) -> None:
+        """
+        Add assets in one pass and publish them at once, order is rebuilt once
+        instead of insertion per asset unless there are only a few assets
+        """
+        if not asset_item_list:
+            return
+
+        with self._write_lock:
+            order = self._snapshot.order
+            row_li = []
+            for asset_item in asset_item_list:
+                row = self.columns.append(
+                    asset_item.name, asset_item.char_code, asset_item.capital, asset_item.interest
+                )
+                self._name_index.setdefault(asset_item.name, row)
+                row_li.append(row)
+
+            if len(row_li) < ORDER_CHUNK_SIZE:
+                for row in row_li:
+                    order = order.insert(row)
+            else:
+                row_li = list(order) + row_li
+                row_li.sort(key=self.columns.get_sort_key)
+                order = RowOrder.from_rows(row_li, self.columns.get_sort_key)
+            self._publish(order)
+
+    def add_if_absent(self, asset_item: AssetItem) -> bool:
+        """
+        Add asset unless asset with the same name is stored, check and add are atomic
+        :return: True if asset has been added
+        """
+        return not self.add_many_if_absent([asset_item])
+
+    def add_many_if_absent(self, asset_item_list: list) -> list:
+        """
+        Add assets with names which are not stored yet (only the first of repeated names),
+        check and add are atomic
+        :return: indexes of assets in asset_item_list which have not been added
+        """
+        with self._write_lock:
+            new_asset_item_list = []
+            rejected_index_list = []
+            new_name_set = set()
+            for index, asset_item in enumerate(asset_item_list):
+                if asset_item.name in self or asset_item.name in new_name_set:
+                    rejected_index_list.append(index)
+                else:
+                    new_name_set.add(asset_item.name)
+                    new_asset_item_list.append(asset_item)
+
+            self.add_many(new_asset_item_list)
+
+        return rejected_index_list
+
+    def clear(self) -> None:
+        with self._write_lock:
+            self.columns = AssetColumnStore()
+            self._name_index = {}
+            self._publish(RowOrder([], self.columns.get_sort_key))
+
+    def get_asset_list(
+            self,
+            name_list: Optional[list] = None,
+            after: Optional[tuple] = None,
+            limit: Optional[int] = None
+    ) -> list:
+        """
+        List of assets as [char_code, name, capital, interest] sorted by char_code and name
+        :param name_list: return only assets with names provided
+        :param after: return only assets following (char_code, name) key
+        :param limit: max number of assets to return
+        """
+        snapshot = self._snapshot
+        columns = snapshot.columns
+        if not name_list:
+            row_li = snapshot.order.get_rows(None if after is None else tuple(after), limit)
+            return [columns.get_row(row) for row in row_li]
+
+        row_li = sorted(
+            (row for row in map(snapshot.name_index.get, set(name_list)) if row is not None and row < snapshot.row_cnt),
+            key=columns.get_sort_key
+        )
+        start = 0 if after is None else bisect_right(row_li, tuple(after), key=columns.get_sort_key)
+        stop = None if limit is None else start + limit
+
+        return [columns.get_row(row) for row in row_li[start:stop]]
+
+    def get_group_columns(self) -> GroupColumns:
+        """
+        Group columns of published snapshot, columns which are changed by writers are copied,
+        so they can be exported as buffers while store is being changed. Group capital which has been
+        changed since snapshot is published is copied again under write lock from the latest snapshot
+        """
+        snapshot = self._snapshot
+        group_capital = snapshot.columns.group_capital[:snapshot.group_cnt]
+        if snapshot.columns.group_capital_version != snapshot.group_capital_version:
+            with self._write_lock:
+                snapshot = self._snapshot
+                group_capital = snapshot.columns.group_capital[:snapshot.group_cnt]
+
+        columns = snapshot.columns
+        group_cnt = snapshot.group_cnt
+
+        return GroupColumns(
+            columns.char_code_li[:],
+            columns.group_code_id[:group_cnt],
+            columns.group_interest[:group_cnt],
+            group_capital
+        )
+
+    def _publish(self, order: RowOrder) -> None:
+        """Make rows appended to columns visible to readers"""
+        columns = self.columns
+        self._snapshot = StoreSnapshot(
+            next(_store_version_counter),
+            columns,
+            self._name_index,
+            order,
+            len(columns),
+            len(columns.group_capital),
+            columns.group_capital_version
+        )
 
     def calculate_revenue(self, period_li: list, key_indicator_col: dict, currency_rate_col: dict) -> dict:
-        res = defaultdict(int)
-        asset_revenue_dict_col = [
-            asset.calculate_revenue(period_li, key_indicator_col, currency_rate_col) for asset in self.asset_collection
+        """
+        Total revenue per period calculated over (char_code, interest) groups of summed capital,
+        so it costs O(groups * periods) and not O(assets * periods). Revenue is rounded to 8 digits
+        per group and not per asset, so it differs from sum of revenues of assets by up to 0.5e-8
+        per asset and per group plus error of float summation (a few ulps of the largest sum)
+        """
+        group_columns = self.get_group_columns()
+        code_rate_li = [
+            resolve_rate(char_code, key_indicator_col, currency_rate_col) for char_code in group_columns.char_code_li
         ]
+        if self.process_pool is not None and len(group_columns.capital) >= PARALLEL_REVENUE_MIN_GROUPS:
+            return self._calculate_revenue_parallel(group_columns, period_li, code_rate_li)
+        if len(group_columns.capital) >= VECTORIZED_REVENUE_MIN_GROUPS and import_numpy() is not None:
+            return self._calculate_revenue_vectorized(group_columns, period_li, code_rate_li)
+
+        res = {}
+        for period in period_li:
+            res[str(period)] = sum(
+                round(capital * code_rate_li[code_id] * ((1.0 + interest) ** period - 1.0), 8)
+                for code_id, capital, interest in zip(
+                    group_columns.code_id, group_columns.capital, group_columns.interest
+                )
+            )
+
+        return res
+
+    @staticmethod
+    def _calculate_revenue_vectorized(group_columns: GroupColumns, period_li: list, code_rate_li: list) -> dict:
+        np = import_numpy()
+        capital = np.frombuffer(group_columns.capital, dtype=np.float64)
+        interest = np.frombuffer(group_columns.interest, dtype=np.float64)
+        code_id = np.frombuffer(group_columns.code_id, dtype=np.uint32)
+        rate = np.array(code_rate_li, dtype=np.float64)[code_id]
+        period_arr = np.asarray(period_li, dtype=np.float64)
+
+        revenue = (capital * rate)[:, None] * ((1.0 + interest)[:, None] ** period_arr - 1.0)
+        total_revenue = np.round(revenue, 8).sum(axis=0)
+
+        return {str(period): float(value) for period, value in zip(period_li, total_revenue)}
+
+    def _calculate_revenue_parallel(self, group_columns: GroupColumns, period_li: list, code_rate_li: list) -> dict:
+        """
+        Copy group columns into shared memory block once, let pool workers sum revenue
+        of their shards and reduce partial sums here
+        """
+        group_cnt = len(group_columns.capital)
+        shard_cnt = self.shard_cnt
+        shm = shared_memory.SharedMemory(create=True, size=20 * group_cnt)
+        try:
+            capital, interest, code_id = get_shared_group_columns(shm.buf, group_cnt)
+            capital[:] = group_columns.capital
+            interest[:] = group_columns.interest
+            code_id[:] = group_columns.code_id
+            del capital, interest, code_id
+
+            bound_li = [group_cnt * i // shard_cnt for i in range(shard_cnt + 1)]
+            future_li = [
+                self.process_pool.submit(
+                    calculate_shared_groups_revenue, shm.name, group_cnt, start, stop, period_li, code_rate_li
+                )
+                for start, stop in zip(bound_li, bound_li[1:])
+            ]
+            partial_li = [future.result() for future in future_li]
+        finally:
+            shm.close()
+            shm.unlink()
+
+        return {str(period): sum(partial[i] for partial in partial_li) for i, period in enumerate(period_li)}
+
+    def iter_revenue_curve(
+            self,
+            period_range: range,
+            key_indicator_col: dict,
+            currency_rate_col: dict
+    ) -> Iterator[list]:
+        """
+        Yield revenue curve over period_range as lists of (period, revenue) pairs,
+        REVENUE_POWER_TABLE_SIZE periods per list. Growth factors of each chunk are
+        (1 + interest) ** first period of chunk multiplied by table of powers
+        (1 + interest) ** (k * step) shared by all chunks, so there is one ** per group per chunk
+        and error of factor is at most REVENUE_POWER_TABLE_SIZE ulps
+        :raise OverflowError: if revenue over period_range exceeds float range, it is raised by call itself,
+            before any chunk is computed
+        """
+        if not period_range:
+            return iter(())
+
+        group_columns = self.get_group_columns()
+        code_rate_li = [
+            resolve_rate(char_code, key_indicator_col, currency_rate_col) for char_code in group_columns.char_code_li
+        ]
+        amount_li = [
+            capital * code_rate_li[code_id] for code_id, capital in zip(group_columns.code_id, group_columns.capital)
+        ]
+        base_li = [1.0 + interest for interest in group_columns.interest]
+        # every growth factor and revenue of curve is bounded by ones of the greatest base at the last period
+        if not math.isfinite(sum(map(abs, amount_li)) * max(base_li, default=1.0) ** period_range[-1]):
+            raise OverflowError(f'revenue at period {period_range[-1]} is out of float range')
+
+        np = import_numpy() if len(base_li) >= VECTORIZED_REVENUE_MIN_GROUPS else None
+        if np is not None:
+            return self._iter_revenue_curve_vectorized(period_range, np.array(amount_li), np.array(base_li))
+
+        return self._iter_revenue_curve_scalar(period_range, amount_li, base_li)
+
+    @staticmethod
+    def _iter_revenue_curve_scalar(period_range: range, amount_li: list, base_li: list) -> Iterator[list]:
+        table_size = min(REVENUE_POWER_TABLE_SIZE, len(period_range))
+        power_table = []
+        for base in base_li:
+            multiplier = base ** period_range.step
+            power_li = [1.0]
+            for _ in range(table_size - 1):
+                power_li.append(power_li[-1] * multiplier)
+            power_table.append(power_li)
+
+        for chunk_start in range(0, len(period_range), table_size):
+            chunk_range = period_range[chunk_start:chunk_start + table_size]
+            revenue_li = [0] * len(chunk_range)
+            for amount, base, power_li in zip(amount_li, base_li, power_table):
+                anchor = base ** chunk_range.start
+                for k in range(len(chunk_range)):
+                    revenue_li[k] += round(amount * (anchor * power_li[k] - 1.0), 8)
+            yield list(zip(chunk_range, revenue_li))
+
+    @staticmethod
+    def _iter_revenue_curve_vectorized(period_range: range, amount, base) -> Iterator[list]:
+        np = import_numpy()
+        table_size = min(REVENUE_POWER_TABLE_SIZE, len(period_range))
+        multiplier = base ** period_range.step
+        power_table = np.ones((len(base), table_size))
+        power_table[:, 1:] = multiplier[:, None]
+        np.cumprod(power_table, axis=1, out=power_table)
+
+        for chunk_start in range(0, len(period_range), table_size):
+            chunk_range = period_range[chunk_start:chunk_start + table_size]
+            factor = (base ** chunk_range.start)[:, None] * power_table[:, :len(chunk_range)]
+            revenue = np.round(amount[:, None] * (factor - 1.0), 8).sum(axis=0)
+            yield list(zip(chunk_range, revenue.tolist()))
+
+
+class RevenueCache:
+    """
+    Thread-safe LRU cache of CompositeAssetItem revenue keyed by set of periods, store version
+    and identity of rate collections. Entry keeps references to its rate collections,
+    so their ids can not be reused by other collections while entry is alive
+    """
+    def __init__(self, maxsize: int = REVENUE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def calculate_revenue(
+            self,
+            store: CompositeAssetItem,
+            period_li: list,
+            key_indicator_col: dict,
+            currency_rate_col: dict
+    ) -> dict:
+        period_tuple = tuple(sorted(set(period_li)))
+        key = (period_tuple, store.version, id(key_indicator_col), id(currency_rate_col))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is key_indicator_col and entry[1] is currency_rate_col:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+
+        if entry is None:
+            revenue = store.calculate_revenue(list(period_tuple), key_indicator_col, currency_rate_col)
+            entry = (key_indicator_col, currency_rate_col, revenue)
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+        revenue = entry[2]
+        return {str(period): revenue[str(period)] for period in period_li}
 
-        for key in period_li:
-            res[str(key)] = sum(map(lambda x: x[key], asset_revenue_dict_col))
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
 
-        return dict(res)
+    def stats(self) -> dict:
+        with self._lock:
+            lookup_cnt = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookup_cnt, 4) if lookup_cnt else None,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
@@ -0,0 +1,51 @@
+"""Compression of response bodies with brotli (if it is installed) or gzip, whichever client accepts"""
+import gzip
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+GZIP_COMPRESS_LEVEL = 5
+BROTLI_QUALITY = 4
+# encodings in order of preference
+AVAILABLE_ENCODINGS = ('gzip',) if brotli is None else ('br', 'gzip')
+
+
+def choose_encoding(accept_encodings, body_size: Optional[int], min_size: Optional[int]) -> Optional[str]:
+    """
+    :param accept_encodings: werkzeug Accept object of Accept-Encoding header
+    :param body_size: size of body, body of unknown size (None) is not compressed
+    :param min_size: smaller bodies are not compressed, None disables compression
+    :return: available encoding with the highest quality for client or None if body is left as is
+    """
+    if min_size is None or body_size is None or body_size < min_size:
+        return None
+
+    return accept_encodings.best_match(AVAILABLE_ENCODINGS)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+
+    return gzip.compress(data, compresslevel=GZIP_COMPRESS_LEVEL)
+
+
+def is_compressible(response, is_streamed: bool) -> bool:
+    """
+    Only complete (not streamed) successful responses which are not encoded yet are compressed,
+    it is checked before body is read, so bodies which are left as is are not joined
+    """
+    return not is_streamed and response.status_code == 200 and 'Content-Encoding' not in response.headers
+
+
+def set_compressed_body(response, body: bytes, encoding: str) -> None:
+    """Replace body with compressed one, strong ETag becomes weak as encoded body differs byte by byte"""
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    etag, is_weak = response.get_etag()
+    if etag and not is_weak:
+        response.set_etag(etag, weak=True)
@@ -0,0 +1,63 @@
+"""
+JSON provider of Flask application serializing with orjson if it is installed,
+stdlib json of default provider is used otherwise (and for options orjson does not have)
+"""
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# keys are sorted as by default provider, dates and dataclasses are passed to default() of provider as well
+ORJSON_OPTIONS = 0 if orjson is None else (
+    orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+)
+
+
+def dumps(obj) -> str:
+    """Compact json of plain obj (lists, dicts, strings and numbers) with the fastest encoder available"""
+    if orjson is None:
+        return json.dumps(obj, separators=(',', ':'))
+
+    return orjson.dumps(obj).decode()
+
+
+class OrjsonProviderMixin:
+    """
+    dumps, loads and response of JSON provider made by orjson, methods of provider class
+    following the mixin are called if orjson is not installed, can not encode object or stdlib options are passed
+    """
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+
+        try:
+            return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS).decode()
+        except orjson.JSONEncodeError:
+            return super().dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Json response with body encoded right into bytes, pretty printed one is made by stdlib json"""
+        if orjson is None or self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        except orjson.JSONEncodeError:
+            return super().response(*args, **kwargs)
+
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+class FastJSONProvider(OrjsonProviderMixin, DefaultJSONProvider):
+    pass
@@ -0,0 +1,118 @@
+"""
+Logging configuration from dict (logging.config.yml) with two extensions of dictConfig schema:
+- queue: yes -- handlers of configured loggers are run by QueueListener thread,
+  logging call only puts record into queue and does not write files
+- filters can use FunctionSamplingFilter to pass only a share of records of chatty routes
+Parsed config is cached as json in __pycache__ next to yaml file, so yaml is neither imported
+nor parsed on start of worker while yaml file is not changed
+"""
+import atexit
+import json
+import logging
+import logging.config
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOGGING_CONFIG_CACHE_DIR = '__pycache__'
+
+
+class DeferredFormatQueueHandler(QueueHandler):
+    """
+    QueueHandler for listener in the same process: record is put into queue as is,
+    so message is formatted by listener thread and not by thread which logs it
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class FunctionSamplingFilter(logging.Filter):
+    """
+    Pass only a share of records logged by functions (e.g. routes) listed in rates,
+    records with level of max_level and above are always passed
+    """
+    def __init__(self, rates: Optional[dict] = None, max_level: str = 'INFO'):
+        super().__init__()
+        self.rates = rates or {}
+        self.max_level = logging.getLevelName(max_level)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+
+        rate = self.rates.get(record.funcName)
+        return rate is None or random.random() < rate
+
+
+def get_logging_config_cache_path(config_path: str) -> str:
+    directory, file_name = os.path.split(config_path)
+    return os.path.join(directory, LOGGING_CONFIG_CACHE_DIR, f'{file_name}.json')
+
+
+def load_logging_config(config_path: str) -> dict:
+    """
+    Load logging config from yaml file or from its json cache if cache was made from file of the same
+    modification time and size. Cache is rewritten after yaml file is changed, failure to write it is ignored
+    :return: config dict for configure_logging
+    """
+    stat = os.stat(config_path)
+    cache_key = [stat.st_mtime_ns, stat.st_size]
+    cache_path = get_logging_config_cache_path(config_path)
+    try:
+        with open(cache_path) as cache_file:
+            cache = json.load(cache_file)
+        if cache['key'] == cache_key:
+            return cache['config']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    import yaml
+
+    with open(config_path) as config_file:
+        config = yaml.safe_load(config_file)
+
+    try:
+        cache_data = json.dumps({'key': cache_key, 'config': config})
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # cache is replaced atomically, so workers starting at once never read half written file
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as cache_file:
+            cache_file.write(cache_data)
+        os.replace(temp_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        pass
+
+    return config
+
+
+def configure_logging(config: dict) -> list:
+    """
+    Configure logging with dictConfig, if config has queue: yes handlers of every configured logger
+    are moved to QueueListener which is stopped (and queue is flushed) at exit
+    :return: list of started queue listeners
+    """
+    config = dict(config)
+    use_queue = config.pop('queue', False)
+    logging.config.dictConfig(config)
+    if not use_queue:
+        return []
+
+    listener_list = []
+    for logger_name in config.get('loggers', {}):
+        logger = logging.getLogger(logger_name)
+        handler_list = list(logger.handlers)
+        if not handler_list:
+            continue
+
+        record_queue = queue.SimpleQueue()
+        for handler in handler_list:
+            logger.removeHandler(handler)
+        logger.addHandler(DeferredFormatQueueHandler(record_queue))
+        listener = QueueListener(record_queue, *handler_list, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        listener_list.append(listener)
+
+    return listener_list
@@ -0,0 +1,118 @@
+"""
+Lightweight latency histograms rendered in Prometheus text exposition format.
+Timers of disabled registry are shared no-op objects, so instrumented code pays one call
+"""
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from threading import Lock
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_null_timer = nullcontext()
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Histogram:
+    """Counts of observed values per bucket (not cumulative, they are summed up on render)"""
+    __slots__ = ('bounds', 'bucket_counts', 'count', 'sum', '_lock')
+
+    def __init__(self, bounds: tuple = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.bucket_counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def render(self, name: str, label: str) -> list:
+        """:return: lines of _bucket, _sum and _count samples, label is already formatted as key="value" """
+        with self._lock:
+            bucket_counts, count, total = list(self.bucket_counts), self.count, self.sum
+
+        line_list = []
+        cumulative_count = 0
+        for bound, bucket_count in zip(self.bounds + (float('inf'),), bucket_counts):
+            cumulative_count += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            line_list.append(f'{name}_bucket{{{label},le="{le}"}} {cumulative_count}')
+        line_list.append(f'{name}_sum{{{label}}} {total!r}')
+        line_list.append(f'{name}_count{{{label}}} {count}')
+
+        return line_list
+
+
+class Timer:
+    """Context manager which observes time spent in its block into histogram"""
+    __slots__ = ('histogram', 'started_at')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.started_at = None
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started_at)
+
+
+class MetricsRegistry:
+    """
+    Histogram families with one label each, e.g. request duration per route.
+    Families are declared upfront with help text, histograms are created per label value on first use
+    """
+    def __init__(self, enabled: bool = False, buckets: tuple = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._lock = Lock()
+        self._family_collection = {}
+
+    def declare(self, name: str, label_name: str, help_text: str) -> None:
+        self._family_collection[name] = (label_name, help_text, {})
+
+    def get_histogram(self, name: str, label_value: str) -> Histogram:
+        histogram_collection = self._family_collection[name][2]
+        histogram = histogram_collection.get(label_value)
+        if histogram is None:
+            with self._lock:
+                histogram = histogram_collection.setdefault(label_value, Histogram(self.buckets))
+
+        return histogram
+
+    def observe(self, name: str, label_value: str, value: float) -> None:
+        if self.enabled:
+            self.get_histogram(name, label_value).observe(value)
+
+    def timer(self, name: str, label_value: str):
+        """:return: context manager timing its block, no-op one if registry is disabled"""
+        if not self.enabled:
+            return _null_timer
+
+        return Timer(self.get_histogram(name, label_value))
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, _, histogram_collection in self._family_collection.values():
+                histogram_collection.clear()
+
+    def render(self) -> str:
+        line_list = []
+        for name, (label_name, help_text, histogram_collection) in self._family_collection.items():
+            line_list.append(f'# HELP {name} {help_text}')
+            line_list.append(f'# TYPE {name} histogram')
+            for label_value, histogram in sorted(histogram_collection.copy().items()):
+                line_list.extend(histogram.render(name, f'{label_name}="{escape_label_value(label_value)}"'))
+
+        return '\n'.join(line_list) + '\n'
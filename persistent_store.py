@@ -0,0 +1,194 @@
+"""
+On-disk backend of CompositeAssetItem: every modification is appended to log
+and log is compacted into columnar snapshot from time to time. On start snapshot
+is memory-mapped and its columns are copied into store as a whole, only log written
+after the snapshot is replayed
+"""
+import json
+import mmap
+import os
+import re
+from array import array
+
+from composite_store import AssetColumnStore, AssetItem, CompositeAssetItem, RowOrder
+
+SNAPSHOT_LOG_SIZE = 64 * 1024 * 1024
+META_FILE_NAME = 'assets.json'
+GENERATION_FILE_PATTERN = re.compile(r'assets\.(\d+)\.(log|snapshot)')
+# columns of snapshot file in the order they are written: (column name, array typecode, row count key of meta)
+SNAPSHOT_COLUMNS = (
+    ('capital', 'd', 'asset_cnt'),
+    ('interest', 'd', 'asset_cnt'),
+    ('code_id', 'I', 'asset_cnt'),
+    ('order', 'I', 'asset_cnt'),
+    ('group_capital', 'd', 'group_cnt'),
+    ('group_interest', 'd', 'group_cnt'),
+    ('group_code_id', 'I', 'group_cnt'),
+)
+
+
+class PersistentAssetStore(CompositeAssetItem):
+    """
+    CompositeAssetItem kept in directory path: assets.json points to current generation
+    of snapshot (assets.N.snapshot) and log (assets.N.log), log is json line per added asset
+    """
+    __slots__ = ('path', 'generation', 'snapshot_log_size', '_log')
+
+    def __init__(
+            self,
+            name: str,
+            path: str,
+            process_pool=None,
+            shard_cnt: int = 1,
+            snapshot_log_size: int = SNAPSHOT_LOG_SIZE
+    ):
+        """
+        :param path: directory of store files, created if it does not exist
+        :param snapshot_log_size: log is compacted into new snapshot when it grows over this size in bytes
+        """
+        super().__init__(name, process_pool=process_pool, shard_cnt=shard_cnt)
+        self.path = path
+        self.generation = 0
+        self.snapshot_log_size = snapshot_log_size
+        self._log = None
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, META_FILE_NAME)
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            self.generation = meta['generation']
+            self._load_snapshot(meta)
+        self._replay_log()
+        self._remove_stale_files()
+        self._log = open(self._get_file_path('log'), 'ab')
+
+    def add(self, asset_item: AssetItem) -> None:
+        with self._write_lock:
+            self._append_log([asset_item])
+            super().add(asset_item)
+            self._compact_log_if_large()
+
+    def add_many(self, asset_item_list: list) -> None:
+        if not asset_item_list:
+            return
+
+        with self._write_lock:
+            self._append_log(asset_item_list)
+            super().add_many(asset_item_list)
+            self._compact_log_if_large()
+
+    def clear(self) -> None:
+        """Clear store, empty snapshot replaces files of previous generation"""
+        with self._write_lock:
+            super().clear()
+            self.snapshot()
+
+    def snapshot(self) -> None:
+        """
+        Write store into snapshot of next generation with empty log. Generation is switched
+        by atomic replace of assets.json, so crash at any step leaves consistent store
+        """
+        with self._write_lock:
+            generation = self.generation + 1
+            columns = self.columns
+            with open(self._get_file_path('snapshot', generation), 'wb') as snapshot_file:
+                for column_name, typecode, _ in SNAPSHOT_COLUMNS:
+                    if column_name == 'order':
+                        array(typecode, self._snapshot.order).tofile(snapshot_file)
+                    else:
+                        getattr(columns, column_name).tofile(snapshot_file)
+                snapshot_file.write(json.dumps(columns.name_li).encode())
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            open(self._get_file_path('log', generation), 'wb').close()
+
+            meta = {
+                'generation': generation,
+                'asset_cnt': len(columns),
+                'group_cnt': len(columns.group_capital),
+                'char_code_li': columns.char_code_li,
+            }
+            meta_path = os.path.join(self.path, META_FILE_NAME)
+            with open(f'{meta_path}.tmp', 'w') as meta_file:
+                json.dump(meta, meta_file)
+                meta_file.flush()
+                os.fsync(meta_file.fileno())
+            os.replace(f'{meta_path}.tmp', meta_path)
+
+            self.generation = generation
+            if self._log is not None:
+                self._log.close()
+            self._log = open(self._get_file_path('log'), 'ab')
+            self._remove_stale_files()
+
+    def close(self) -> None:
+        """Compact not empty log into snapshot, so the next start does not replay it, and close log"""
+        with self._write_lock:
+            if self._log.tell():
+                self.snapshot()
+            self._log.close()
+
+    def _get_file_path(self, kind: str, generation: int = None) -> str:
+        return os.path.join(self.path, f'assets.{self.generation if generation is None else generation}.{kind}')
+
+    def _load_snapshot(self, meta: dict) -> None:
+        column_dict = {column_name: array(typecode) for column_name, typecode, _ in SNAPSHOT_COLUMNS}
+        with open(self._get_file_path('snapshot'), 'rb') as snapshot_file:
+            with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer, memoryview(buffer) as view:
+                offset = 0
+                for column_name, _, row_cnt_key in SNAPSHOT_COLUMNS:
+                    column = column_dict[column_name]
+                    size = column.itemsize * meta[row_cnt_key]
+                    column.frombytes(view[offset:offset + size])
+                    offset += size
+                name_li = json.loads(view[offset:].tobytes())
+
+        self.columns = AssetColumnStore.from_columns(
+            name_li,
+            meta['char_code_li'],
+            column_dict['code_id'],
+            column_dict['capital'],
+            column_dict['interest'],
+            column_dict['group_code_id'],
+            column_dict['group_interest'],
+            column_dict['group_capital']
+        )
+        self._name_index = dict(zip(reversed(name_li), range(len(name_li) - 1, -1, -1)))
+        self._publish(RowOrder.from_rows(column_dict['order'].tolist(), self.columns.get_sort_key))
+
+    def _replay_log(self) -> None:
+        """Add assets logged after snapshot, incomplete last line of interrupted write is cut off"""
+        log_path = self._get_file_path('log')
+        if not os.path.exists(log_path):
+            return
+
+        with open(log_path, 'rb+') as log_file:
+            data = log_file.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                log_file.truncate(end)
+
+        asset_item_list = [
+            AssetItem(name, char_code, capital, interest)
+            for char_code, name, capital, interest in map(json.loads, data[:end].splitlines())
+        ]
+        super().add_many(asset_item_list)
+
+    def _append_log(self, asset_item_list: list) -> None:
+        self._log.write(b''.join(
+            json.dumps([asset_item.char_code, asset_item.name, asset_item.capital, asset_item.interest]).encode()
+            + b'\n'
+            for asset_item in asset_item_list
+        ))
+        self._log.flush()
+
+    def _compact_log_if_large(self) -> None:
+        if self._log.tell() >= self.snapshot_log_size:
+            self.snapshot()
+
+    def _remove_stale_files(self) -> None:
+        for file_name in os.listdir(self.path):
+            match = GENERATION_FILE_PATTERN.fullmatch(file_name)
+            if match and int(match.group(1)) != self.generation:
+                os.remove(os.path.join(self.path, file_name))
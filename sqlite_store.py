@@ -0,0 +1,167 @@
+"""
+Backend of CompositeAssetItem shared by worker processes of one host through SQLite file in WAL mode.
+Every process keeps in-memory mirror of assets table and pulls rows added by other processes
+when database has been changed, so all workers serve the same assets
+"""
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+from composite_store import AssetItem, CompositeAssetItem
+
+SQLITE_BUSY_TIMEOUT = 10
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS assets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    char_code TEXT NOT NULL,
+    name TEXT NOT NULL,
+    capital REAL NOT NULL,
+    interest REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS assets_name ON assets (name);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+'''
+
+
+class SQLiteAssetStore(CompositeAssetItem):
+    """
+    CompositeAssetItem mirrored from SQLite database. Assets are added to database first and
+    then pulled into mirror by id order; cleanup bumps generation in meta table, so other
+    processes drop their mirrors instead of pulling deleted rows.
+    Write lock of store guards connection and mirror, conditional inserts check names in database,
+    so name taken by another process is not added twice. Changes are detected without write lock
+    by read-only connection of each thread
+    """
+    __slots__ = ('path', '_connection', '_pid', '_data_version', '_generation', '_last_row_id', '_local')
+
+    def __init__(self, name: str, path: str, process_pool=None, shard_cnt: int = 1):
+        super().__init__(name, process_pool=process_pool, shard_cnt=shard_cnt)
+        self.path = path
+        self._connection = None
+        self._pid = None
+        self._data_version = None
+        self._generation = None
+        self._last_row_id = 0
+        self._local = threading.local()
+        self._get_connection()
+        self.sync()
+
+    def sync(self) -> None:
+        """
+        Pull changes made by other connections, write lock is taken only if database
+        has been changed since last pull
+        """
+        data_version, = self._get_version_connection().execute('PRAGMA data_version').fetchone()
+        if data_version == self._data_version:
+            return
+
+        with self._write_lock:
+            # version is taken before pull, so changes made during pull are pulled by the next sync
+            self._data_version = data_version
+            self._pull(self._get_connection())
+
+    def add(self, asset_item: AssetItem) -> None:
+        self.add_many([asset_item])
+
+    def add_many(self, asset_item_list: list) -> None:
+        if not asset_item_list:
+            return
+
+        with self._write_lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.executemany(
+                    'INSERT INTO assets (char_code, name, capital, interest) VALUES (?, ?, ?, ?)',
+                    [
+                        (asset_item.char_code, asset_item.name, asset_item.capital, asset_item.interest)
+                        for asset_item in asset_item_list
+                    ]
+                )
+            self._pull(connection)
+
+    def add_many_if_absent(self, asset_item_list: list) -> list:
+        rejected_index_list = []
+        with self._write_lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                for index, asset_item in enumerate(asset_item_list):
+                    cursor = connection.execute(
+                        'INSERT INTO assets (char_code, name, capital, interest) '
+                        'SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM assets WHERE name = ?)',
+                        (
+                            asset_item.char_code, asset_item.name, asset_item.capital, asset_item.interest,
+                            asset_item.name
+                        )
+                    )
+                    if not cursor.rowcount:
+                        rejected_index_list.append(index)
+            self._pull(connection)
+
+        return rejected_index_list
+
+    def clear(self) -> None:
+        with self._write_lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.execute('DELETE FROM assets')
+                connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+            self._pull(connection)
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Connection of current process, forked worker opens its own one instead of inherited"""
+        if self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path,
+                timeout=SQLITE_BUSY_TIMEOUT,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SQLITE_SCHEMA)
+            self._connection, self._pid = connection, os.getpid()
+
+        return self._connection
+
+    def _get_version_connection(self) -> sqlite3.Connection:
+        """Read-only connection of current thread and process used to check data version of database"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(
+                f'file:{quote(os.path.abspath(self.path))}?mode=ro',
+                uri=True,
+                timeout=SQLITE_BUSY_TIMEOUT,
+                isolation_level=None
+            )
+            local.pid = os.getpid()
+
+        return local.connection
+
+    def _pull(self, connection: sqlite3.Connection) -> None:
+        """
+        Add rows which are not in mirror yet, mirror is rebuilt if database has been cleaned up.
+        Generation and rows are read in one transaction, so they are from the same snapshot of database
+        """
+        with connection:
+            connection.execute('BEGIN')
+            generation, = connection.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+            if generation != self._generation:
+                super().clear()
+                self._generation = generation
+                self._last_row_id = 0
+
+            row_list = connection.execute(
+                'SELECT id, char_code, name, capital, interest FROM assets WHERE id > ? ORDER BY id',
+                (self._last_row_id,)
+            ).fetchall()
+
+        if row_list:
+            self._last_row_id = row_list[-1][0]
+            super().add_many([
+                AssetItem(name, char_code, capital, interest) for _, char_code, name, capital, interest in row_list
+            ])
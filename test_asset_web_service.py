@@ -1,19 +1,51 @@
 from argparse import Namespace
+import atexit
+import base64
 from collections import namedtuple
-from unittest.mock import patch
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+import gzip
+import io
+import json
+import logging
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from unittest.mock import Mock, patch
 import pytest
 
+import asset_web_service
+import composite_store
+from logging_setup import configure_logging, FunctionSamplingFilter, load_logging_config
 from asset_web_service import (
     app,
     AssetItem,
     CBR_CURRENCY_RATE_URL,
     CBR_KEY_INDICATORS_URL,
+    CBR_REQUEST_TIMEOUT,
+    cbr_page_collection,
+    cbr_session,
     CompositeAssetItem,
     JSON_DAILY_ROUTE,
     JSON_KEY_INDICATORS_ROUTE,
     parse_cbr_currency_daily_html,
     parse_cbr_key_indicators_html,
+    PersistentAssetStore,
+    CBRServiceUnavailableError,
+    RATE_CACHE_STATS_ROUTE,
+    RateRefresher,
+    RateSnapshotCache,
+    REQUEST_DURATION_METRIC,
+    REVENUE_CURVE_STREAM_MIN_PERIODS,
     requests,
+    RevenueCache,
+    SingleFlight,
+    STAGE_DURATION_METRIC,
+    SQLiteAssetStore,
 )
 
 CBR_CURRENCY_DAILY_HTML_SNAPSHOT = 'cbr_currency_base_daily.html'
@@ -97,6 +129,316 @@ def client():
         yield client
 
 
+@pytest.fixture(autouse=True)
+def clean_rate_cache():
+    app.rate_cache.clear()
+    cbr_page_collection.clear()
+    yield
+    app.rate_cache.clear()
+    cbr_page_collection.clear()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rate_cache_calls_loader_only_on_miss():
+    clock = FakeClock()
+    cache = RateSnapshotCache(ttl=10, clock=clock)
+    loaded_url_list = []
+
+    def loader(url):
+        loaded_url_list.append(url)
+        return {'USD': 73.7961}
+
+    assert {'USD': 73.7961} == cache.get('url', loader)
+    clock.now = 9
+    assert {'USD': 73.7961} == cache.get('url', loader)
+    assert ['url'] == loaded_url_list
+
+    clock.now = 10
+    cache.get('url', loader)
+    assert ['url', 'url'] == loaded_url_list
+
+    stats = cache.stats()
+    assert 1 == stats['hits']
+    assert 2 == stats['misses']
+    assert {'url': 0} == stats['age']
+
+
+def test_rate_cache_serves_stale_entry_while_revalidating():
+    clock = FakeClock()
+    cache = RateSnapshotCache(ttl=10, stale_ttl=100, clock=clock)
+    cache.put('url', {'USD': 73.7961})
+    reload_allowed = threading.Event()
+    loader = Mock(side_effect=lambda url: reload_allowed.wait(timeout=5) and {'USD': 74.0})
+
+    clock.now = 50
+    # stale entry is served to every caller while it is reloaded once
+    assert {'USD': 73.7961} == cache.get('url', loader)
+    assert {'USD': 73.7961} == cache.get('url', loader)
+    reload_allowed.set()
+
+    for _ in range(500):
+        value = cache.get('url', loader)
+        if value != {'USD': 73.7961}:
+            break
+        time.sleep(0.01)
+    assert {'USD': 74.0} == value
+    loader.assert_called_once_with('url')
+
+
+def test_rate_cache_reloads_stale_entry_again_after_parse_error():
+    clock = FakeClock()
+    cache = RateSnapshotCache(ttl=10, stale_ttl=100, clock=clock)
+    cache.put('url', {'USD': 73.7961})
+    loader = Mock(side_effect=[ValueError('could not convert string to float'), {'USD': 74.0}])
+
+    clock.now = 50
+    for _ in range(500):
+        value = cache.get('url', loader)
+        if value != {'USD': 73.7961}:
+            break
+        time.sleep(0.01)
+    assert {'USD': 74.0} == value
+    assert 2 == loader.call_count
+
+
+def test_single_flight_shares_one_call_between_concurrent_callers():
+    single_flight = SingleFlight()
+    caller_cnt = 8
+    call_list = []
+
+    def load(url):
+        call_list.append(url)
+        for _ in range(500):
+            if single_flight.coalesced == caller_cnt - 1:
+                break
+            time.sleep(0.01)
+        return {'url': url}
+
+    result_list = []
+    thread_list = [
+        threading.Thread(target=lambda: result_list.append(single_flight.do('url', load, 'url')))
+        for _ in range(caller_cnt)
+    ]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+
+    assert ['url'] == call_list
+    assert [{'url': 'url'}] * caller_cnt == result_list
+    assert {'calls': 1, 'coalesced': caller_cnt - 1, 'in_flight': 0} == single_flight.stats()
+
+
+def test_single_flight_shares_exception_and_forgets_failed_call():
+    single_flight = SingleFlight()
+
+    def fail(url):
+        raise CBRServiceUnavailableError('get request status code: 503')
+
+    for _ in range(2):
+        with pytest.raises(CBRServiceUnavailableError):
+            single_flight.do('url', fail, 'url')
+
+    assert {'calls': 2, 'coalesced': 0, 'in_flight': 0} == single_flight.stats()
+
+
+def test_rate_refresher_keeps_previous_values_on_failure():
+    fail_url_set = set()
+
+    def loader(url):
+        if url in fail_url_set:
+            raise CBRServiceUnavailableError('get request status code: 503')
+        return {'url': url}
+
+    refresher = RateRefresher(['url_1', 'url_2'], loader)
+    refresher.refresh()
+    first_snapshot = refresher.snapshot
+    assert {'url_1': {'url': 'url_1'}, 'url_2': {'url': 'url_2'}} == first_snapshot.collections
+
+    fail_url_set.add('url_2')
+    with pytest.raises(CBRServiceUnavailableError):
+        refresher.refresh()
+    assert first_snapshot is not refresher.snapshot
+    assert first_snapshot.collections == refresher.snapshot.collections
+
+
+def test_rate_refresher_survives_loader_errors():
+    def loader(url):
+        # the first loads fail to parse page, e.g. markup of cbr.ru has been changed
+        if loader_mock.call_count < 3:
+            raise ValueError(f'could not convert string to float: {url}')
+        return {'url': url}
+
+    loader_mock = Mock(side_effect=loader)
+    refresher = RateRefresher(['url'], loader_mock, interval=100, retry_delay=0.01)
+    with pytest.raises(CBRServiceUnavailableError):
+        refresher.refresh()
+    assert {} == refresher.snapshot.collections
+
+    refresher.start()
+    try:
+        for _ in range(500):
+            if refresher.snapshot.collections:
+                break
+            time.sleep(0.01)
+        assert refresher.is_alive()
+    finally:
+        refresher.stop()
+    assert {'url': {'url': 'url'}} == refresher.snapshot.collections
+    assert 3 == loader_mock.call_count
+
+
+def test_rate_refresher_backoff_grows_up_to_limit():
+    refresher = RateRefresher([], loader=None, retry_delay=1, max_backoff=10)
+    for failures, max_delay in [(1, 1), (2, 2), (3, 4), (10, 10)]:
+        refresher.failures = failures
+        assert max_delay / 2 <= refresher.backoff_delay() <= max_delay
+
+
+def test_service_reads_rates_from_refresher_snapshot(client, capsys):
+    refresher = RateRefresher([CBR_KEY_INDICATORS_URL, CBR_CURRENCY_RATE_URL], read_parsed_file)
+    with patch.object(app, 'rate_refresher', refresher):
+        response = client.get('/api/asset/calculate_revenue?period=1')
+        assert 503 == response.status_code
+
+        refresher.refresh()
+        with patch.object(cbr_session, 'get', side_effect=AssertionError):
+            response = client.get(JSON_DAILY_ROUTE)
+        assert 200 == response.status_code
+        assert CURRENCY_DAILY_RATE_CNT == len(response.json)
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
+def test_service_fetches_cbr_pages_concurrently_with_timeout(client, capsys):
+    barrier = threading.Barrier(2, timeout=5)
+
+    def read_file_in_parallel(url, **kwargs):
+        barrier.wait()
+        return read_file(url, **kwargs)
+
+    with patch.object(cbr_session, 'get', side_effect=read_file_in_parallel) as get_mock:
+        response = client.get('/api/asset/calculate_revenue?period=1')
+
+    assert 200 == response.status_code
+    assert 2 == get_mock.call_count
+    assert all(CBR_REQUEST_TIMEOUT == call.kwargs['timeout'] for call in get_mock.call_args_list)
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
+def test_service_takes_cached_cbr_pages_without_executor(client, capsys):
+    with patch.object(cbr_session, 'get', side_effect=read_file):
+        assert 200 == client.get('/api/asset/calculate_revenue?period=1').status_code
+
+    with patch.object(cbr_session, 'get', side_effect=read_file) as get_mock, \
+            patch.object(asset_web_service.cbr_executor, 'submit') as submit_mock:
+        response = client.get('/api/asset/calculate_revenue?period=1')
+
+    assert 200 == response.status_code
+    assert 0 == get_mock.call_count
+    assert 0 == submit_mock.call_count
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
+def test_service_exposes_request_and_stage_duration_metrics(client, capsys):
+    with patch.object(app.metrics, 'enabled', False):
+        assert isinstance(app.metrics.timer(STAGE_DURATION_METRIC, 'cbr_fetch'), nullcontext)
+
+    app.metrics.clear()
+    with patch.object(app.metrics, 'enabled', True), patch.object(cbr_session, 'get', side_effect=read_file):
+        response = client.get('/api/asset/calculate_revenue?period=1&period=2')
+        assert 200 == response.status_code
+        client.get('/not_existing_route')
+        response = client.get('/metrics')
+    app.metrics.clear()
+
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    sample_collection = dict(
+        line.rsplit(' ', 1) for line in response.get_data(as_text=True).splitlines() if not line.startswith('#')
+    )
+    for route, count in [('/api/asset/calculate_revenue', '1'), ('not_found', '1')]:
+        assert count == sample_collection[f'{REQUEST_DURATION_METRIC}_count{{route="{route}"}}']
+        assert count == sample_collection[f'{REQUEST_DURATION_METRIC}_bucket{{route="{route}",le="+Inf"}}']
+    for stage, count in [
+        ('cbr_fetch', '2'), ('cbr_parse', '2'), ('revenue_calculation', '1'), ('json_serialization', '1')
+    ]:
+        assert count == sample_collection[f'{STAGE_DURATION_METRIC}_count{{stage="{stage}"}}']
+    assert f'# TYPE {REQUEST_DURATION_METRIC} histogram' in response.get_data(as_text=True)
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
+def test_service_sends_conditional_requests_to_cbr_site(client, capsys):
+    def read_file_with_etag(url, headers, **kwargs):
+        if headers.get('If-None-Match') == '"daily-etag"':
+            return Namespace(status_code=304, text='', headers={})
+        response = read_file(url)
+        response.headers = {'ETag': '"daily-etag"', 'Last-Modified': 'Fri, 15 Jan 2021 12:00:00 GMT'}
+        return response
+
+    with patch.object(cbr_session, 'get', side_effect=read_file_with_etag) as get_mock:
+        response = client.get(JSON_DAILY_ROUTE)
+        app.rate_cache.clear()
+        not_modified_response = client.get(JSON_DAILY_ROUTE)
+
+    assert {} == get_mock.call_args_list[0].kwargs['headers']
+    assert {
+        'If-None-Match': '"daily-etag"',
+        'If-Modified-Since': 'Fri, 15 Jan 2021 12:00:00 GMT',
+    } == get_mock.call_args_list[1].kwargs['headers']
+    assert 200 == not_modified_response.status_code
+    assert response.json == not_modified_response.json
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
+@pytest.mark.parametrize('route', [JSON_DAILY_ROUTE, JSON_KEY_INDICATORS_ROUTE])
+def test_service_replies_not_modified_to_known_etag(client, route, capsys):
+    with patch.object(cbr_session, 'get', side_effect=read_file):
+        response = client.get(route)
+        assert 200 == response.status_code
+        assert response.headers['ETag']
+
+        response = client.get(route, headers={'If-None-Match': response.headers['ETag']})
+        assert 304 == response.status_code
+        assert b'' == response.data
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
+def test_service_reuses_cached_cbr_pages(client, capsys):
+    with patch.object(cbr_session, 'get', side_effect=read_file) as get_mock:
+        for _ in range(3):
+            response = client.get(JSON_DAILY_ROUTE)
+            assert 200 == response.status_code
+    assert 1 == get_mock.call_count
+
+    response = client.get(RATE_CACHE_STATS_ROUTE)
+    assert 200 == response.status_code
+    stats = response.json
+    assert 2 == stats['hits']
+    assert 1 == stats['misses']
+    assert [CBR_CURRENCY_RATE_URL] == list(stats['age'])
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
 def test_service_reply_to_incorrect_path(client, capsys):
     response = client.get('/not_existing_route')
     assert 404 == response.status_code
@@ -116,7 +458,7 @@ def test_service_reply_to_incorrect_path(client, capsys):
 )
 def test_service_get_503_status_code_when_cbr_site_unavailable(client, capsys, route):
     with patch.object(
-            requests,
+            cbr_session,
             'get',
             return_value=Namespace(status_code=503)
     ):
@@ -129,14 +471,24 @@ def test_service_get_503_status_code_when_cbr_site_unavailable(client, capsys, r
     assert '' == captured.out, 'stdout must be empty'
 
 
+def test_service_get_503_status_code_when_cbr_site_timed_out(client, capsys):
+    with patch.object(cbr_session, 'get', side_effect=requests.Timeout):
+        response = client.get(JSON_DAILY_ROUTE)
+
+    assert 503 == response.status_code
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
 def test_service_make_get_currency_rate_in_json(client, capsys):
     with open(CBR_CURRENCY_DAILY_HTML_SNAPSHOT, 'r') as f_in:
         html_document = f_in.read()
 
     with patch.object(
-            requests,
+            cbr_session,
             'get',
-            return_value=Namespace(status_code=200, text=html_document)
+            return_value=Namespace(status_code=200, text=html_document, headers={})
     ):
         response = client.get(JSON_DAILY_ROUTE)
     assert 200 == response.status_code
@@ -158,9 +510,9 @@ def test_service_make_get_key_indicators_in_json(client, capsys):
         html_document = f_in.read()
 
     with patch.object(
-            requests,
+            cbr_session,
             'get',
-            return_value=Namespace(status_code=200, text=html_document)
+            return_value=Namespace(status_code=200, text=html_document, headers={})
     ):
         response = client.get(JSON_KEY_INDICATORS_ROUTE)
     assert 200 == response.status_code
@@ -222,6 +574,81 @@ def test_composite_store_assets_correctly(asset_test_collection):
     assert etalon_result == composite_asset_store.get_asset_list(name_list)
 
 
+def test_composite_store_looks_up_assets_by_name(asset_test_collection):
+    composite_asset_store = CompositeAssetItem(
+        name='asset_store',
+        asset_collection=[asset.item for asset in asset_test_collection]
+    )
+    assert 'asset_USD' in composite_asset_store
+    assert 'asset_GGG' not in composite_asset_store
+    assert asset_test_collection[2].list_repr == composite_asset_store.get_asset_list(['asset_USD', 'asset_USD'])
+
+    composite_asset_store.clear()
+    assert 'asset_USD' not in composite_asset_store
+    assert [] == composite_asset_store.get_asset_list(['asset_USD'])
+    assert [] == composite_asset_store.get_asset_list()
+
+
+def test_composite_store_keeps_assets_sorted_by_char_code_and_name():
+    composite_asset_store = CompositeAssetItem(name='asset_store')
+    version_list = [composite_asset_store.version]
+    for char_code, name in [('USD', 'b'), ('EUR', 'c'), ('USD', 'a'), ('AUD', 'd')]:
+        composite_asset_store.add(AssetItem(name=name, char_code=char_code, capital=1_000, interest=0.1))
+        version_list.append(composite_asset_store.version)
+
+    assert [['AUD', 'd'], ['EUR', 'c'], ['USD', 'a'], ['USD', 'b']] == [
+        asset[:2] for asset in composite_asset_store.get_asset_list()
+    ]
+    assert [['EUR', 'c'], ['USD', 'b']] == [asset[:2] for asset in composite_asset_store.get_asset_list(['b', 'c'])]
+
+    composite_asset_store.clear()
+    version_list.append(composite_asset_store.version)
+    assert len(set(version_list)) == len(version_list)
+
+
+@pytest.mark.parametrize('batch_size', [1, 3, 40], ids=['add', 'small add_many', 'large add_many'])
+def test_composite_store_keeps_order_across_chunks(batch_size):
+    rnd = random.Random(0)
+    row_list = [[rnd.choice(['USD', 'EUR', 'AUD']), f'asset_{rnd.random():.6f}', 1_000, 0.1] for _ in range(200)]
+    with patch.object(composite_store, 'ORDER_CHUNK_SIZE', 4):
+        composite_asset_store = CompositeAssetItem(name='asset_store')
+        for start in range(0, len(row_list), batch_size):
+            composite_asset_store.add_many([
+                AssetItem(name, char_code, capital, interest)
+                for char_code, name, capital, interest in row_list[start:start + batch_size]
+            ])
+        published_list = composite_asset_store.get_asset_list()
+        composite_asset_store.add(AssetItem('asset_new', 'EUR', 1_000, 0.1))
+
+        assert 1 < len(composite_asset_store._snapshot.order.chunk_li)
+        assert all(len(chunk) <= 8 for chunk in composite_asset_store._snapshot.order.chunk_li)
+        assert sorted(row_list) == published_list
+        assert sorted(row_list + [['EUR', 'asset_new', 1_000, 0.1]]) == composite_asset_store.get_asset_list()
+        page_list = []
+        after = None
+        while True:
+            page = composite_asset_store.get_asset_list(after=after, limit=9)
+            page_list.extend(page)
+            if len(page) < 9:
+                break
+            after = page[-1][:2]
+        assert composite_asset_store.get_asset_list() == page_list
+
+
+def test_composite_store_assets_in_columns(asset_test_collection):
+    composite_asset_store = CompositeAssetItem(name='asset_store')
+    for _ in range(2):
+        for asset in asset_test_collection:
+            composite_asset_store.add(asset.item)
+
+    assert 8 == len(composite_asset_store)
+    assert ['EUR', 'RUB', 'USD', 'XDR'] == composite_asset_store.columns.char_code_li
+    assert [asset.list_repr[0] for asset in asset_test_collection] == [
+        asset.get_asset_list() for asset in composite_asset_store.asset_collection[:4]
+    ]
+    assert not hasattr(composite_asset_store.asset_collection[0], '__dict__')
+
+
 @pytest.mark.parametrize(
     ('asset_index_list', 'period_list', 'true_revenue_dict'),
     [
@@ -256,6 +683,461 @@ def test_composite_calc_assets_revenue_correctly(
     assert true_revenue_dict == result
 
 
+@pytest.fixture()
+def large_asset_collection():
+    rnd = random.Random(0)
+    char_code_list = ['RUB', 'USD', 'EUR', 'Au', 'XDR', 'AUD']
+    return [
+        AssetItem(
+            name=f'asset_{i}',
+            char_code=rnd.choice(char_code_list),
+            capital=round(rnd.uniform(1, 100_000), 2),
+            interest=round(rnd.uniform(0.01, 0.99), 4)
+        )
+        for i in range(5_000)
+    ]
+
+
+@pytest.mark.skipif(composite_store.import_numpy() is None, reason='numpy is not installed')
+def test_composite_vectorized_revenue_matches_per_asset_revenue(large_asset_collection):
+    key_indicator_collection = {'USD': 73.9735, 'EUR': 89.3304, 'Au': 4361.69}
+    currency_rate_collection = {'XDR': 56.7525, 'AUD': 57.0229}
+    period_list = [0, 1, 2, 5, 10, 30]
+    composite_asset_store = CompositeAssetItem(name='asset_store', asset_collection=large_asset_collection)
+
+    result = composite_asset_store.calculate_revenue(period_list, key_indicator_collection, currency_rate_collection)
+    with patch.object(composite_store, 'VECTORIZED_REVENUE_MIN_GROUPS', float('inf')):
+        per_asset_result = composite_asset_store.calculate_revenue(
+            period_list,
+            key_indicator_collection,
+            currency_rate_collection
+        )
+
+    assert list(per_asset_result) == list(result)
+    for period, revenue in per_asset_result.items():
+        assert revenue == pytest.approx(result[period], rel=1e-12, abs=1e-8)
+
+
+def test_composite_grouped_revenue_matches_revenue_of_each_asset(large_asset_collection):
+    key_indicator_collection = {'USD': 73.9735, 'EUR': 89.3304, 'Au': 4361.69}
+    currency_rate_collection = {'XDR': 56.7525, 'AUD': 57.0229}
+    period_list = [0, 1, 2, 5, 10, 30]
+    for asset in large_asset_collection:
+        asset.interest = round(asset.interest, 1)
+    composite_asset_store = CompositeAssetItem(name='asset_store', asset_collection=large_asset_collection)
+
+    assert len(composite_asset_store.columns.group_capital) <= 6 * 11
+    assert sum(composite_asset_store.columns.capital) == pytest.approx(sum(composite_asset_store.columns.group_capital))
+
+    result = composite_asset_store.calculate_revenue(period_list, key_indicator_collection, currency_rate_collection)
+    group_cnt = len(composite_asset_store.columns.group_capital)
+    for period in period_list:
+        revenue_list = [
+            asset.calculate_revenue([period], key_indicator_collection, currency_rate_collection)[period]
+            for asset in large_asset_collection
+        ]
+        # revenue is rounded per group, so each asset and each group adds up to half of the last digit,
+        # float summation of assets and of groups adds up to an ulp of their sum per term
+        tolerance = (
+            0.5e-8 * (len(revenue_list) + group_cnt)
+            + sys.float_info.epsilon * (len(revenue_list) + group_cnt) * sum(map(abs, revenue_list))
+        )
+        assert sum(revenue_list) == pytest.approx(result[str(period)], rel=0, abs=tolerance)
+
+
+@pytest.mark.parametrize('vectorized_min_groups', [float('inf'), 1], ids=['per group', 'vectorized'])
+def test_composite_revenue_curve_matches_revenue_of_periods(large_asset_collection, vectorized_min_groups):
+    key_indicator_collection = {'USD': 73.9735, 'EUR': 89.3304, 'Au': 4361.69}
+    currency_rate_collection = {'XDR': 56.7525, 'AUD': 57.0229}
+    period_range = range(0, 400, 3)
+    composite_asset_store = CompositeAssetItem(name='asset_store', asset_collection=large_asset_collection[:500])
+
+    period_revenue = composite_asset_store.calculate_revenue(
+        list(period_range),
+        key_indicator_collection,
+        currency_rate_collection
+    )
+    with patch.object(composite_store, 'VECTORIZED_REVENUE_MIN_GROUPS', vectorized_min_groups):
+        curve = list(composite_asset_store.iter_revenue_curve(
+            period_range,
+            key_indicator_collection,
+            currency_rate_collection
+        ))
+
+    assert [64, 64, 6] == [len(chunk) for chunk in curve]
+    assert list(period_range) == [period for chunk in curve for period, _ in chunk]
+    for chunk in curve:
+        for period, revenue in chunk:
+            assert period_revenue[str(period)] == pytest.approx(revenue, rel=1e-12)
+
+    with patch.object(composite_store, 'VECTORIZED_REVENUE_MIN_GROUPS', vectorized_min_groups), \
+            pytest.raises(OverflowError):
+        composite_asset_store.iter_revenue_curve(range(0, 2000), key_indicator_collection, currency_rate_collection)
+
+
+def test_composite_parallel_revenue_matches_single_process_revenue(large_asset_collection):
+    key_indicator_collection = {'USD': 73.9735, 'EUR': 89.3304, 'Au': 4361.69}
+    currency_rate_collection = {'XDR': 56.7525, 'AUD': 57.0229}
+    period_list = [0, 1, 2, 5, 10, 30]
+    with ProcessPoolExecutor(2) as process_pool:
+        composite_asset_store = CompositeAssetItem(
+            name='asset_store',
+            asset_collection=large_asset_collection,
+            process_pool=process_pool,
+            shard_cnt=3
+        )
+        with patch.object(composite_store, 'PARALLEL_REVENUE_MIN_GROUPS', 0):
+            result = composite_asset_store.calculate_revenue(
+                period_list,
+                key_indicator_collection,
+                currency_rate_collection
+            )
+        single_process_result = composite_asset_store.calculate_revenue(
+            period_list,
+            key_indicator_collection,
+            currency_rate_collection
+        )
+
+    assert list(single_process_result) == list(result)
+    for period, revenue in single_process_result.items():
+        assert revenue == pytest.approx(result[period], rel=1e-12, abs=1e-8)
+
+
+def test_service_store_calculates_revenue_in_forkserver_workers(large_asset_collection):
+    key_indicator_collection = {'USD': 73.9735, 'EUR': 89.3304, 'Au': 4361.69}
+    currency_rate_collection = {'XDR': 56.7525, 'AUD': 57.0229}
+    with patch.object(asset_web_service, 'REVENUE_PROCESS_CNT', 2), \
+            patch.object(multiprocessing, 'get_context', wraps=multiprocessing.get_context) as get_context_mock:
+        store = asset_web_service.create_asset_store()
+    get_context_mock.assert_called_once_with('forkserver')
+    try:
+        store.add_many(large_asset_collection[:100])
+        with patch.object(composite_store, 'PARALLEL_REVENUE_MIN_GROUPS', 0):
+            result = store.calculate_revenue([1, 5], key_indicator_collection, currency_rate_collection)
+    finally:
+        store.process_pool.shutdown()
+
+    assert store.calculate_revenue([1, 5], key_indicator_collection, currency_rate_collection) == pytest.approx(
+        result, rel=1e-12
+    )
+
+
+def test_persistent_store_restores_assets_from_snapshot_and_log(tmp_path, asset_test_collection):
+    persistent_store = PersistentAssetStore(name='asset_store', path=str(tmp_path))
+    persistent_store.add_many([asset_test_collection[0].item, asset_test_collection[1].item])
+    persistent_store.snapshot()
+    persistent_store.add(asset_test_collection[2].item)
+    asset_list = persistent_store.get_asset_list()
+    persistent_store._log.close()
+
+    with open(tmp_path / 'assets.1.log', 'ab') as log_file:
+        log_file.write(b'["XDR", "asset_')
+    restored_store = PersistentAssetStore(name='asset_store', path=str(tmp_path))
+    assert asset_list == restored_store.get_asset_list()
+    assert 'asset_EUR' in restored_store
+    assert persistent_store.columns.group_capital == restored_store.columns.group_capital
+
+    restored_store.add(asset_test_collection[3].item)
+    restored_store.close()
+    assert ['assets.2.log', 'assets.2.snapshot', 'assets.json'] == sorted(path.name for path in tmp_path.iterdir())
+    restored_store = PersistentAssetStore(name='asset_store', path=str(tmp_path))
+    assert [asset.list_repr[0] for asset in asset_test_collection] == [
+        asset.get_asset_list() for asset in restored_store.asset_collection
+    ]
+
+    restored_store.clear()
+    restored_store.close()
+    assert [] == PersistentAssetStore(name='asset_store', path=str(tmp_path)).get_asset_list()
+
+
+def test_persistent_store_compacts_log_into_snapshot(tmp_path, large_asset_collection):
+    persistent_store = PersistentAssetStore(name='asset_store', path=str(tmp_path), snapshot_log_size=64 * 1024)
+    for asset in large_asset_collection[:100]:
+        persistent_store.add(asset)
+    persistent_store.add_many(large_asset_collection[100:])
+
+    assert 0 < persistent_store.generation
+    assert persistent_store.get_asset_list() == PersistentAssetStore(
+        name='asset_store',
+        path=str(tmp_path)
+    ).get_asset_list()
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path, asset_test_collection):
+    database_path = str(tmp_path / 'assets.db')
+    worker_store = SQLiteAssetStore(name='asset_store', path=database_path)
+    other_worker_store = SQLiteAssetStore(name='asset_store', path=database_path)
+
+    worker_store.add(asset_test_collection[2].item)
+    other_worker_store.add_many([asset_test_collection[0].item, asset_test_collection[1].item])
+    version = worker_store.version
+    worker_store.sync()
+    assert version != worker_store.version
+    assert worker_store.get_asset_list() == other_worker_store.get_asset_list()
+    assert ['EUR', 'RUB', 'USD'] == [asset[0] for asset in worker_store.get_asset_list()]
+
+    version = worker_store.version
+    worker_store.sync()
+    assert version == worker_store.version
+    # unchanged database is checked without write lock
+    with patch.object(worker_store, '_write_lock', None):
+        worker_store.sync()
+
+    other_worker_store.clear()
+    other_worker_store.add(asset_test_collection[3].item)
+    worker_store.sync()
+    assert asset_test_collection[3].list_repr == worker_store.get_asset_list()
+    assert 'asset_USD' not in worker_store
+    new_worker_store = SQLiteAssetStore(name='asset_store', path=database_path)
+    assert asset_test_collection[3].list_repr == new_worker_store.get_asset_list()
+
+
+def test_service_lists_assets_added_by_other_worker(client, tmp_path):
+    database_path = str(tmp_path / 'assets.db')
+    other_worker_store = SQLiteAssetStore(name='asset_store', path=database_path)
+    with patch.object(app, 'bank', SQLiteAssetStore(name='asset_composite', path=database_path)):
+        response = client.get('/api/asset/add/USD/asset_USD/1000/0.1')
+        assert 200 == response.status_code
+        assert [['USD', 'asset_USD', 1000, 0.1]] == client.get('/api/asset/list').json
+
+        other_worker_store.add(AssetItem(name='asset_EUR', char_code='EUR', capital=2_000, interest=0.05))
+        assert ['asset_EUR', 'asset_USD'] == [asset[1] for asset in client.get('/api/asset/list').json]
+        response = client.get('/api/asset/add/EUR/asset_EUR/2000/0.05')
+        assert 403 == response.status_code
+
+
+STRESS_THREAD_CNT = 32
+
+
+@pytest.fixture()
+def frequent_thread_switches():
+    """Threads are switched every microsecond, so races show up in a short test"""
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(switch_interval)
+
+
+def run_in_threads(function, thread_cnt: int = STRESS_THREAD_CNT) -> list:
+    """Run function(thread_index) in thread_cnt threads started at once and return their results"""
+    barrier = threading.Barrier(thread_cnt)
+    result_list = [None] * thread_cnt
+    error_list = []
+
+    def run(thread_index):
+        barrier.wait()
+        try:
+            result_list[thread_index] = function(thread_index)
+        except BaseException as error:
+            error_list.append(error)
+
+    thread_list = [threading.Thread(target=run, args=(i,)) for i in range(thread_cnt)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+
+    assert [] == error_list
+    return result_list
+
+
+@pytest.mark.parametrize('store_kind', ['memory', 'persistent', 'sqlite'])
+def test_store_adds_each_name_once_under_concurrent_conditional_inserts(tmp_path, frequent_thread_switches, store_kind):
+    store = {
+        'memory': lambda: CompositeAssetItem(name='asset_store'),
+        'persistent': lambda: PersistentAssetStore(name='asset_store', path=str(tmp_path)),
+        'sqlite': lambda: SQLiteAssetStore(name='asset_store', path=str(tmp_path / 'assets.db')),
+    }[store_kind]()
+    name_cnt = 100
+
+    def add_names(thread_index):
+        name_list = [f'asset_{i}' for i in random.Random(thread_index).sample(range(name_cnt), name_cnt)]
+        if thread_index % 2:
+            return sum(store.add_if_absent(AssetItem(name, 'USD', 1_000, 0.1)) for name in name_list)
+
+        added_cnt = 0
+        for start in range(0, name_cnt, 10):
+            asset_item_list = [AssetItem(name, 'EUR', 1_000, 0.1) for name in name_list[start:start + 10]]
+            added_cnt += len(asset_item_list) - len(store.add_many_if_absent(asset_item_list))
+        return added_cnt
+
+    assert name_cnt == sum(run_in_threads(add_names))
+    asset_list = store.get_asset_list()
+    assert name_cnt == len(store) == len(asset_list) == len({asset[1] for asset in asset_list})
+    assert sorted(asset_list) == asset_list
+
+
+def test_store_sums_group_capital_in_place_and_readers_get_published_capital():
+    store = CompositeAssetItem(name='asset_store', asset_collection=[AssetItem('a', 'USD', 1_000, 0.1)])
+    group_capital = store.columns.group_capital
+    group_columns = store.get_group_columns()
+    store.add(AssetItem('b', 'USD', 500, 0.1))
+
+    assert group_capital is store.columns.group_capital
+    assert [1_000] == list(group_columns.capital)
+    assert [1_500] == list(store.get_group_columns().capital)
+
+
+def test_store_readers_see_published_snapshots_while_writers_add(frequent_thread_switches):
+    store = CompositeAssetItem(name='asset_store')
+    batch_size = 16
+    batch_cnt = 20
+    key_indicator_collection = {'USD': 73.9735}
+
+    def add_or_read(thread_index):
+        if thread_index % 4:
+            for _ in range(batch_cnt):
+                asset_list = store.get_asset_list()
+                # batch is published at once, so readers never see a part of it
+                assert 0 == len(asset_list) % batch_size
+                assert sorted(asset_list) == asset_list
+                store.calculate_revenue([1, 5], key_indicator_collection, {})
+                store.get_asset_list([asset[1] for asset in asset_list[:10]], limit=5)
+            return 0
+
+        for batch_index in range(batch_cnt):
+            interest_list = [(batch_index * batch_size + i + 1) / 1000 for i in range(batch_size)]
+            store.add_many([
+                AssetItem(f'asset_{thread_index}_{batch_index}_{i}', 'USD', 1_000, interest)
+                for i, interest in enumerate(interest_list)
+            ])
+        return batch_cnt * batch_size
+
+    assert sum(run_in_threads(add_or_read)) == len(store)
+    assert composite_store.VECTORIZED_REVENUE_MIN_GROUPS <= len(store.get_group_columns().capital)
+    assert store.calculate_revenue([1], key_indicator_collection, {}) == CompositeAssetItem(
+        name='asset_store', asset_collection=list(store.iter_asset_items())
+    ).calculate_revenue([1], key_indicator_collection, {})
+
+
+def test_service_rejects_concurrent_adds_of_the_same_name(client, frequent_thread_switches):
+    client.get('/api/asset/cleanup')
+
+    def add_names(thread_index):
+        with app.test_client() as thread_client:
+            return [
+                thread_client.get(f'/api/asset/add/USD/concurrent_{i}/1000/0.1').status_code for i in range(20)
+            ]
+
+    status_code_list_per_thread = run_in_threads(add_names)
+    for i in range(20):
+        assert [200] + [403] * (STRESS_THREAD_CNT - 1) == sorted(
+            status_code_list[i] for status_code_list in status_code_list_per_thread
+        )
+    assert 20 == len(client.get('/api/asset/list').json)
+    client.get('/api/asset/cleanup')
+
+
+class ThreadRecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.message_list = []
+
+    def emit(self, record):
+        self.message_list.append((self.format(record), threading.current_thread()))
+
+
+def test_queue_logging_formats_records_in_listener_thread():
+    handler = ThreadRecordingHandler()
+    listener_list = configure_logging({
+        'version': 1,
+        'queue': True,
+        'filters': {'sampling': {'()': FunctionSamplingFilter, 'rates': {'log_sampled': 0}}},
+        'handlers': {'recording': {'()': lambda: handler, 'level': 'INFO'}},
+        'loggers': {
+            'test_queue_logging': {
+                'level': 'INFO', 'filters': ['sampling'], 'handlers': ['recording'], 'propagate': False
+            }
+        },
+        'disable_existing_loggers': False,
+    })
+    logger = logging.getLogger('test_queue_logging')
+
+    def log_sampled():
+        logger.info('sampled %s', 'out')
+        logger.warning('sampled %s', 'warning')
+
+    class Argument:
+        str_thread_list = []
+
+        def __str__(self):
+            self.str_thread_list.append(threading.current_thread())
+            return 'argument'
+
+    logger.debug('disabled %s', Argument())
+    logger.info('called %s route', Argument())
+    log_sampled()
+    listener_thread_list = [listener._thread for listener in listener_list]
+    for listener in listener_list:
+        listener.stop()
+        atexit.unregister(listener.stop)
+
+    assert 1 == len(listener_list)
+    assert ['called argument route', 'sampled warning'] == [message for message, _ in handler.message_list]
+    assert listener_thread_list == Argument.str_thread_list
+    assert threading.current_thread() not in {thread for _, thread in handler.message_list}
+
+
+
+def test_logging_config_is_loaded_from_cache_until_yaml_changes(tmp_path):
+    config_path = tmp_path / 'logging.config.yml'
+    config_path.write_text('version: 1\nqueue: yes\n')
+
+    assert {'version': 1, 'queue': True} == load_logging_config(str(config_path))
+    assert (tmp_path / '__pycache__' / 'logging.config.yml.json').exists()
+
+    with patch.dict(sys.modules, {'yaml': None}):
+        assert {'version': 1, 'queue': True} == load_logging_config(str(config_path))
+
+    config_path.write_text('version: 1\nqueue: no\n')
+    assert {'version': 1, 'queue': False} == load_logging_config(str(config_path))
+
+
+def test_service_import_loads_neither_heavy_dependencies_nor_logging(tmp_path):
+    """Worker start does not pay for requests, lxml, yaml and numpy, and log files are not opened by import"""
+    code = (
+        'import json, logging, sys; import asset_web_service; '
+        'print(json.dumps([sorted({"requests", "lxml", "yaml", "numpy"} & set(sys.modules)), '
+        'len(logging.getLogger("asset_web_service").handlers)]))'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=os.path.dirname(os.path.abspath(asset_web_service.__file__)),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    assert [[], 0] == json.loads(result.stdout)
+
+
+def test_revenue_cache_invalidates_on_store_and_rate_change(asset_test_collection):
+    key_indicator_collection = {'USD': 73.9735, 'EUR': 89.3304, 'Au': 4361.69}
+    currency_rate_collection = {'XDR': 56.7525}
+    composite_asset_store = CompositeAssetItem(
+        name='asset_store',
+        asset_collection=[asset_test_collection[0].item, asset_test_collection[3].item]
+    )
+    revenue_cache = RevenueCache(maxsize=2)
+
+    def calculate(period_list, key_col=key_indicator_collection):
+        return revenue_cache.calculate_revenue(composite_asset_store, period_list, key_col, currency_rate_collection)
+
+    assert {'1': 19148.49, '2': 39969.486000000004, '5': 114257.87954521} == calculate([1, 2, 5])
+    assert {'5': 114257.87954521, '2': 39969.486000000004, '1': 19148.49} == calculate([5, 2, 1, 1])
+    assert 1 == revenue_cache.stats()['misses']
+
+    with patch.object(CompositeAssetItem, 'calculate_revenue', side_effect=AssertionError):
+        assert 39969.486000000004 == calculate([2, 1, 5])['2']
+
+    composite_asset_store.add(asset_test_collection[1].item)
+    calculate([1, 2, 5])
+    calculate([1, 2, 5], key_col=dict(key_indicator_collection))
+    stats = revenue_cache.stats()
+    assert (2, 3) == (stats['hits'], stats['misses'])
+    assert 2 == stats['size']
+
+
 @pytest.mark.parametrize(
     ('route', 'expected_status_code', 'message'),
     [
@@ -327,7 +1209,7 @@ def test_service_can_return_assets_list_with_provided_names(
     assert '' == captured.out, 'stdout must be empty'
 
 
-def read_file(url: str) -> Namespace:
+def read_file(url: str, **kwargs) -> Namespace:
     if url == CBR_KEY_INDICATORS_URL:
         file_path = CBR_KEY_INDICATORS_HTML_SNAPSHOT
     elif url == CBR_CURRENCY_RATE_URL:
@@ -338,7 +1220,16 @@ def read_file(url: str) -> Namespace:
     with open(file_path, 'r') as f_in:
         result = f_in.read()
 
-    return Namespace(text=result, url=url, status_code=200)
+    return Namespace(text=result, url=url, status_code=200, headers={})
+
+
+def read_parsed_file(url: str) -> dict:
+    parse_function = {
+        CBR_KEY_INDICATORS_URL: parse_cbr_key_indicators_html,
+        CBR_CURRENCY_RATE_URL: parse_cbr_currency_daily_html,
+    }[url]
+
+    return parse_function(read_file(url).text)
 
 
 @pytest.mark.parametrize(
@@ -353,7 +1244,7 @@ def read_file(url: str) -> Namespace:
     ]
 )
 def test_service_can_calculate_assets_revenue_behind_periods_provided(client, route, true_result, capsys):
-    with patch.object(requests, 'get', side_effect=read_file):
+    with patch.object(cbr_session, 'get', side_effect=read_file):
         response = client.get(f'/api/asset/calculate_revenue?{route}')
 
     assert 200 == response.status_code
@@ -366,6 +1257,21 @@ def test_service_can_calculate_assets_revenue_behind_periods_provided(client, ro
     assert '' == captured.out, 'stdout must be empty'
 
 
+def test_service_caches_serialized_assets_list(client, capsys):
+    client.get('/api/asset/add/USD/asset_cached/1000/0.1')
+    response = client.get('/api/asset/list')
+    with patch.object(CompositeAssetItem, 'get_asset_list', side_effect=AssertionError):
+        cached_response = client.get('/api/asset/list')
+    assert response.json == cached_response.json
+
+    client.get('/api/asset/add/EUR/asset_cached_2/1000/0.1')
+    response = client.get('/api/asset/list')
+    assert len(cached_response.json) + 1 == len(response.json)
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
 def test_service_can_clean_assets_store(client, capsys):
     response = client.get('/api/asset/cleanup')
     assert 200 == response.status_code
@@ -376,3 +1282,267 @@ def test_service_can_clean_assets_store(client, capsys):
 
     captured = capsys.readouterr()
     assert '' == captured.out, 'stdout must be empty'
+
+
+@pytest.fixture()
+def client_with_assets(client):
+    client.get('/api/asset/cleanup')
+    for char_code, name in [('USD', 'b'), ('EUR', 'c'), ('USD', 'a'), ('AUD', 'd'), ('EUR', 'e')]:
+        client.get(f'/api/asset/add/{char_code}/{name}/1000/0.1')
+    yield client
+    client.get('/api/asset/cleanup')
+
+
+@pytest.mark.parametrize(
+    ('route', 'limit', 'expected_name_pages'),
+    [
+        pytest.param('/api/asset/list?', 2, [['d', 'c'], ['e', 'a'], ['b']], id='list by 2'),
+        pytest.param('/api/asset/list?', 5, [['d', 'c', 'e', 'a', 'b']], id='list by 5'),
+        pytest.param('/api/asset/get?name=a&name=b&name=e&', 2, [['e', 'a'], ['b']], id='get by 2'),
+    ]
+)
+def test_service_can_return_assets_list_by_pages(client_with_assets, route, limit, expected_name_pages, capsys):
+    name_pages = []
+    cursor = ''
+    while cursor is not None:
+        response = client_with_assets.get(f'{route}limit={limit}&cursor={cursor}'.replace('&cursor=&', '&'))
+        assert 200 == response.status_code
+        name_pages.append([asset[1] for asset in response.json['assets']])
+        cursor = response.json['next_cursor']
+
+    if not name_pages[-1]:
+        name_pages.pop()
+    assert expected_name_pages == name_pages
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
+@pytest.mark.parametrize(
+    'route',
+    [
+        pytest.param('/api/asset/list?limit=0', id='zero limit'),
+        pytest.param('/api/asset/list?cursor=bad_cursor', id='bad cursor'),
+        *[
+            pytest.param(f'/api/asset/list?cursor={base64.urlsafe_b64encode(key.encode()).decode()}', id=key_id)
+            for key, key_id in [
+                ('{"USD": "a"}', 'cursor of dict'),
+                ('["USD"]', 'cursor of one value'),
+                ('["USD", "a", "b"]', 'cursor of three values'),
+                ('["USD", 1]', 'cursor of not str value'),
+                ('"USD"', 'cursor of str'),
+            ]
+        ],
+        pytest.param('/api/asset/list?stream=xml', id='bad stream format'),
+    ]
+)
+def test_service_rejects_bad_pagination_arguments(client_with_assets, route):
+    response = client_with_assets.get(route)
+    assert 400 == response.status_code
+
+
+def test_service_can_stream_assets_list(client_with_assets, capsys):
+    full_list = client_with_assets.get('/api/asset/list').json
+    with patch.object(asset_web_service, 'ASSET_STREAM_CHUNK_SIZE', 2):
+        json_response = client_with_assets.get('/api/asset/list?stream=json')
+        ndjson_response = client_with_assets.get('/api/asset/list?stream=ndjson')
+
+    assert full_list == json_response.json
+    assert 'application/x-ndjson' == ndjson_response.mimetype
+    assert full_list == [json.loads(line) for line in ndjson_response.data.decode().splitlines()]
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
+def test_service_compresses_large_responses(client_with_assets, capsys):
+    full_list = client_with_assets.get('/api/asset/list').json
+    with patch.object(app, 'response_compression_min_size', 100):
+        response = client_with_assets.get('/api/asset/list', headers={'Accept-Encoding': 'gzip'})
+        with patch.object(asset_web_service, 'compress', side_effect=AssertionError):
+            cached_response = client_with_assets.get('/api/asset/list', headers={'Accept-Encoding': 'gzip'})
+        small_response = client_with_assets.get('/api/asset/get?name=a', headers={'Accept-Encoding': 'gzip'})
+        identity_response = client_with_assets.get('/api/asset/list', headers={'Accept-Encoding': 'identity'})
+
+        with patch.object(cbr_session, 'get', side_effect=read_file):
+            daily_response = client_with_assets.get(JSON_DAILY_ROUTE, headers={'Accept-Encoding': 'gzip'})
+        not_modified_response = client_with_assets.get(
+            JSON_DAILY_ROUTE,
+            headers={'Accept-Encoding': 'gzip', 'If-None-Match': daily_response.headers['ETag']}
+        )
+
+    assert 'gzip' == response.headers['Content-Encoding']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert full_list == json.loads(gzip.decompress(response.data))
+    assert response.data == cached_response.data
+    assert 'Content-Encoding' not in small_response.headers
+    assert 'Content-Encoding' not in identity_response.headers
+    assert full_list == identity_response.json
+
+    assert 'gzip' == daily_response.headers['Content-Encoding']
+    assert daily_response.headers['ETag'].startswith('W/')
+    assert CURRENCY_DAILY_RATE_CNT == len(json.loads(gzip.decompress(daily_response.data)))
+    assert 304 == not_modified_response.status_code
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
+def test_service_reads_only_bodies_which_are_compressed():
+    response_list = [
+        ({'Accept-Encoding': 'identity'}, app.response_class('x' * 200)),
+        ({'Accept-Encoding': 'gzip'}, app.response_class(io.BytesIO(b'x' * 200), direct_passthrough=True)),
+    ]
+    with patch.object(app, 'response_compression_min_size', 100):
+        for headers, response in response_list:
+            with app.test_request_context(headers=headers), \
+                    patch.object(response, 'get_data', side_effect=AssertionError):
+                assert response is asset_web_service.compress_response(response)
+            assert 'Content-Encoding' not in response.headers
+
+
+def test_json_provider_matches_stdlib_json():
+    obj = {'b': [1, 2.5, 'text'], 'a': {'2': None, '10': True}, 'c': 'кириллица'}
+    with app.app_context():
+        response = app.json.response(obj)
+        assert b'\n' == response.data[-1:]
+        assert json.dumps(obj, sort_keys=True) == json.dumps(json.loads(response.data))
+        assert obj == app.json.loads(app.json.dumps(obj))
+        assert '{"big": 18446744073709551616}' == app.json.dumps({'big': 2 ** 64})
+        assert 2 ** 64 == app.json.response(2 ** 64).json
+
+
+def test_service_calculates_revenue_over_period_range(client_with_assets, capsys):
+    with patch.object(cbr_session, 'get', side_effect=read_file):
+        period_revenue = client_with_assets.get(
+            '/api/asset/calculate_revenue?' + '&'.join(f'period={period}' for period in range(2, 11, 2))
+        ).json
+        response = client_with_assets.get('/api/asset/calculate_revenue?period_from=2&period_to=11&step=2')
+        with patch.object(asset_web_service, 'REVENUE_CURVE_STREAM_MIN_PERIODS', 3):
+            streamed_response = client_with_assets.get('/api/asset/calculate_revenue?period_from=2&period_to=10&step=2')
+
+    assert 'Content-Length' in response.headers
+    assert 'Content-Length' not in streamed_response.headers
+    for curve in [response.json, streamed_response.json]:
+        assert ['2', '4', '6', '8', '10'] == sorted(curve, key=int)
+        for period, revenue in curve.items():
+            assert period_revenue[period] == pytest.approx(revenue, rel=1e-12)
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
+@pytest.mark.parametrize(
+    'query',
+    [
+        pytest.param('period_from=8000&period_to=8000', id='listed curve'),
+        pytest.param(f'period_from=0&period_to={REVENUE_CURVE_STREAM_MIN_PERIODS * 8}', id='streamed curve'),
+    ]
+)
+def test_service_rejects_revenue_curve_out_of_float_range(client_with_assets, query):
+    with patch.object(cbr_session, 'get', side_effect=read_file):
+        response = client_with_assets.get(f'/api/asset/calculate_revenue?{query}')
+
+    assert 400 == response.status_code
+    assert 'Content-Length' in response.headers
+
+
+@pytest.mark.parametrize(
+    'query',
+    [
+        pytest.param('period_from=5', id='no period_to'),
+        pytest.param('period_from=5&period_to=1', id='empty range'),
+        pytest.param('period_from=-1&period_to=1', id='negative period'),
+        pytest.param('period_from=1&period_to=5&step=0', id='zero step'),
+        pytest.param('period_from=1&period_to=5&step=abc', id='not integer step'),
+        pytest.param('period_from=1&period_to=5&step=', id='empty step'),
+        pytest.param('period_from=1&period_to=5&period=7', id='range and period list'),
+        pytest.param('period_from=0&period_to=10000000', id='too many periods'),
+    ]
+)
+def test_service_rejects_bad_period_range(client, query):
+    with patch.object(cbr_session, 'get', side_effect=read_file):
+        response = client.get(f'/api/asset/calculate_revenue?{query}')
+    assert 400 == response.status_code
+
+
+@pytest.mark.parametrize(
+    ('content_type', 'body'),
+    [
+        pytest.param(
+            'application/json',
+            json.dumps([
+                ['RUB', 'bulk_RUB', 100_000, 0.15],
+                {'char_code': 'USD', 'name': 'bulk_USD', 'capital': '1000', 'interest': '0.1'},
+                ['USD', 'bulk_bad_interest', 1_000, 2],
+                ['USD', 'a', 1_000, 0.1],
+                ['USD', 'bulk_RUB', 1_000, 0.1],
+                ['USD', 'bulk_short_row'],
+            ]),
+            id='json'
+        ),
+        pytest.param(
+            'application/x-ndjson',
+            '["RUB", "bulk_RUB", 100000, 0.15]\n'
+            '{"char_code": "USD", "name": "bulk_USD", "capital": 1000, "interest": 0.1}\n'
+            '["USD", "bulk_bad_interest", 1000, 2]\n'
+            '["USD", "a", 1000, 0.1]\n'
+            '["USD", "bulk_RUB", 1000, 0.1]\n'
+            '["USD", "bulk_short_row"]\n',
+            id='ndjson'
+        ),
+        pytest.param(
+            'text/csv',
+            'char_code,name,capital,interest\n'
+            'RUB,bulk_RUB,100000,0.15\n'
+            'USD,bulk_USD,1000,0.1\n'
+            'USD,bulk_bad_interest,1000,2\n'
+            'USD,a,1000,0.1\n'
+            'USD,bulk_RUB,1000,0.1\n'
+            'USD,bulk_short_row\n',
+            id='csv'
+        ),
+    ]
+)
+def test_service_can_bulk_add_assets(client_with_assets, content_type, body, capsys):
+    response = client_with_assets.post('/api/asset/bulk_add', data=body, content_type=content_type)
+    assert 200 == response.status_code
+    assert 2 == response.json['added']
+    assert [(2, 400), (3, 403), (4, 403), (5, 400)] == [
+        (error['row'], error['status_code']) for error in response.json['errors']
+    ]
+
+    response = client_with_assets.get('/api/asset/get?name=bulk_RUB&name=bulk_USD')
+    assert [['RUB', 'bulk_RUB', 100_000, 0.15], ['USD', 'bulk_USD', 1_000, 0.1]] == response.json
+
+    captured = capsys.readouterr()
+    assert '' == captured.out, 'stdout must be empty'
+
+
+def test_service_reports_malformed_ndjson_lines_by_line_number(client_with_assets):
+    body = (
+        '["RUB", "bulk_RUB", 100000, 0.15]\n'
+        '\n'
+        '["USD", "bulk_broken", 1000\n'
+        '["USD", "bulk_USD", 1000, 0.1]\n'
+        '["USD", "bulk_bad_interest", 1000, 2]\n'
+    )
+    response = client_with_assets.post('/api/asset/bulk_add', data=body, content_type='application/x-ndjson')
+
+    assert 200 == response.status_code
+    assert 2 == response.json['added']
+    assert [(2, 400), (4, 400)] == [(error['row'], error['status_code']) for error in response.json['errors']]
+    assert response.json['errors'][0]['message'].startswith('bad json line')
+
+
+@pytest.mark.parametrize(
+    ('content_type', 'body', 'expected_status_code'),
+    [
+        pytest.param('application/json', '{"name": "a"}', 400, id='json object instead of array'),
+        pytest.param('application/json', '[', 400, id='broken json'),
+        pytest.param('application/xml', '<assets/>', 415, id='unsupported content type'),
+    ]
+)
+def test_service_rejects_bad_bulk_add_body(client_with_assets, content_type, body, expected_status_code):
+    response = client_with_assets.post('/api/asset/bulk_add', data=body, content_type=content_type)
+    assert expected_status_code == response.status_code
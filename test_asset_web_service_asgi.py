@@ -0,0 +1,185 @@
+from argparse import Namespace
+import asyncio
+import gzip
+import json
+from unittest.mock import patch
+import pytest
+
+pytest.importorskip('quart')
+pytest.importorskip('httpx')
+
+from asset_web_service import cbr_page_collection, JSON_DAILY_ROUTE, JSON_KEY_INDICATORS_ROUTE
+import asset_web_service_asgi
+from asset_web_service_asgi import app, AsyncSingleFlight
+from test_asset_web_service import CURRENCY_DAILY_RATE_CNT, KEY_INDICATORS_CNT, read_file
+
+
+class FakeCBRClient:
+    def __init__(self, status_code: int = 200, concurrent_request_cnt: int = 1):
+        self.status_code = status_code
+        self.concurrent_request_cnt = concurrent_request_cnt
+        self.in_flight_cnt = 0
+        self.url_list = []
+
+    async def get(self, url, headers=None):
+        self.url_list.append(url)
+        self.in_flight_cnt += 1
+        while self.in_flight_cnt < self.concurrent_request_cnt:
+            await asyncio.sleep(0.001)
+
+        if self.status_code >= 400:
+            return Namespace(status_code=self.status_code)
+        return read_file(url)
+
+
+@pytest.fixture()
+def cbr_client():
+    app.rate_cache.clear()
+    cbr_page_collection.clear()
+    app.cbr_client = FakeCBRClient()
+    app.cbr_single_flight = AsyncSingleFlight()
+    yield app.cbr_client
+    app.rate_cache.clear()
+    cbr_page_collection.clear()
+
+
+@pytest.fixture()
+def client(cbr_client):
+    app.bank.clear()
+    yield app.test_client()
+    app.bank.clear()
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, timeout=10))
+
+
+def test_async_service_reply_to_incorrect_path(client):
+    async def scenario():
+        response = await client.get('/not_existing_route')
+        assert 404 == response.status_code
+        assert 'This route is not found' in await response.get_data(as_text=True)
+
+    run(scenario())
+
+
+@pytest.mark.parametrize(
+    'route',
+    [
+        pytest.param(JSON_DAILY_ROUTE, id=JSON_DAILY_ROUTE),
+        pytest.param(JSON_KEY_INDICATORS_ROUTE, id=JSON_KEY_INDICATORS_ROUTE),
+        pytest.param('/api/asset/calculate_revenue?period=1', id='/api/asset/calculate_revenue')
+    ]
+)
+def test_async_service_get_503_status_code_when_cbr_site_unavailable(client, cbr_client, route):
+    cbr_client.status_code = 503
+
+    async def scenario():
+        response = await client.get(route)
+        assert 503 == response.status_code
+        assert 'CBR service is unavailable' in await response.get_data(as_text=True)
+
+    run(scenario())
+
+
+@pytest.mark.parametrize(
+    ('route', 'expected_cnt'),
+    [
+        pytest.param(JSON_DAILY_ROUTE, CURRENCY_DAILY_RATE_CNT, id=JSON_DAILY_ROUTE),
+        pytest.param(JSON_KEY_INDICATORS_ROUTE, KEY_INDICATORS_CNT, id=JSON_KEY_INDICATORS_ROUTE),
+    ]
+)
+def test_async_service_returns_cbr_collections_with_etag(client, cbr_client, route, expected_cnt):
+    async def scenario():
+        response = await client.get(route)
+        assert 200 == response.status_code
+        assert expected_cnt == len(await response.get_json())
+
+        response = await client.get(route, headers={'If-None-Match': response.headers['ETag']})
+        assert 304 == response.status_code
+
+    run(scenario())
+    assert 1 == len(cbr_client.url_list)
+
+
+def test_async_service_coalesces_concurrent_cbr_requests(client, cbr_client):
+    cbr_client.concurrent_request_cnt = 2
+    request_cnt = 5
+
+    async def scenario():
+        response_list = await asyncio.gather(
+            *[client.get('/api/asset/calculate_revenue?period=1') for _ in range(request_cnt)]
+        )
+        assert all(200 == response.status_code for response in response_list)
+
+        response = await client.get('/cbr/cache_stats')
+        return (await response.get_json())['single_flight']
+
+    single_flight_stats = run(scenario())
+    assert 2 == len(cbr_client.url_list)
+    assert 2 * (request_cnt - 1) == single_flight_stats['coalesced']
+
+
+def test_async_revalidation_is_retried_after_parse_error(cbr_client):
+    app.rate_cache.put('url', {'USD': 73.7961})
+    with patch.object(app.rate_cache, 'ttl', 0), patch.object(
+            asset_web_service_asgi, 'load_cbr_collection', side_effect=ValueError('could not convert string to float')
+    ):
+        assert ({'USD': 73.7961}, True) == app.rate_cache.lookup('url')
+        assert ({'USD': 73.7961}, False) == app.rate_cache.lookup('url')
+        run(asset_web_service_asgi.revalidate_cbr_collection('url'))
+        assert ({'USD': 73.7961}, True) == app.rate_cache.lookup('url')
+
+
+def test_async_service_manages_assets_and_calculates_revenue(client, cbr_client):
+    cbr_client.concurrent_request_cnt = 2
+
+    async def scenario():
+        for route in ['USD/asset_USD/1000/0.1', 'RUB/asset_RUB/100000/0.15', 'EUR/asset_EUR/2000/0.05']:
+            response = await client.get(f'/api/asset/add/{route}')
+            assert 200 == response.status_code
+        response = await client.post(
+            '/api/asset/bulk_add',
+            data=json.dumps([['XDR', 'asset_XDR', 1500, 0.12], ['XDR', 'asset_XDR', 1500, 0.12]]),
+            headers={'Content-Type': 'application/json'}
+        )
+        result = await response.get_json()
+        assert 1 == result['added']
+        assert [(1, 403)] == [(error['row'], error['status_code']) for error in result['errors']]
+
+        response = await client.get('/api/asset/add/USD/asset_USD/1000/0.1')
+        assert 403 == response.status_code
+
+        response = await client.get('/api/asset/list')
+        asset_list = await response.get_json()
+        assert ['EUR', 'RUB', 'USD', 'XDR'] == [asset[0] for asset in asset_list]
+
+        min_size, app.response_compression_min_size = app.response_compression_min_size, 100
+        try:
+            response = await client.get('/api/asset/list', headers={'Accept-Encoding': 'gzip'})
+        finally:
+            app.response_compression_min_size = min_size
+        assert 'gzip' == response.headers['Content-Encoding']
+        assert asset_list == json.loads(gzip.decompress(await response.get_data()))
+
+        response = await client.get('/api/asset/list?stream=ndjson')
+        assert asset_list == [json.loads(line) for line in (await response.get_data(as_text=True)).splitlines()]
+
+        response = await client.get('/api/asset/get?name=asset_USD&name=asset_RUB&limit=1')
+        assert [['RUB', 'asset_RUB', 100_000, 0.15]] == (await response.get_json())['assets']
+
+        response = await client.get('/api/asset/calculate_revenue?period=2&period=5&period=10')
+        assert {'2': 107646.77634, '5': 320150.36198168, '10': 878631.11308631} == await response.get_json()
+
+        response = await client.get('/api/asset/calculate_revenue?period_from=5&period_to=10&step=5')
+        assert {'5': 320150.36198168, '10': 878631.11308631} == pytest.approx(await response.get_json(), rel=1e-12)
+
+        response = await client.get('/api/asset/calculate_revenue?period_from=0&period_to=10000')
+        assert 400 == response.status_code
+
+        response = await client.get('/api/asset/cleanup')
+        assert 200 == response.status_code
+        response = await client.get('/api/asset/list')
+        assert [] == await response.get_json()
+
+    run(scenario())